@@ -0,0 +1,408 @@
+import csv
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from itertools import islice
+import tracemalloc
+from corretor import (Corretor, LexiconTagger, ReGra, ArrayReGra, RadixReGra, MappedReGra, DeleteIndex, BKTree, read_lexicon,
+                      WordData, features_mask, FoldedIndex, fold, write_shards,
+                      levenshtein_distance, batch_levenshtein)
+
+
+def measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, memory, elapsed
+
+
+def memoria(path: str):
+    # Compara a memória ocupada por cada representação do dicionário
+    for name, cls in [('ReGra', ReGra), ('ArrayReGra', ArrayReGra), ('RadixReGra', RadixReGra)]:
+        def build():
+            dictionary = cls()
+            dictionary.extend(read_lexicon(path))
+            return dictionary
+
+        dictionary, memory, elapsed = measure(build)
+        if cls is ReGra:
+            regra = dictionary
+
+        print(f'{name:<12} {memory / 2**20:>10.1f} MiB {elapsed:>8.1f}s')
+
+    # O arquivo compilado é mapeado e não conta como memória do processo
+    with tempfile.TemporaryDirectory() as tmp:
+        compiled = os.path.join(tmp, 'dicionario.regra')
+        regra.compile(compiled)
+
+        mapped, memory, elapsed = measure(lambda: MappedReGra(compiled))
+        print(f'{"MappedReGra":<12} {memory / 2**20:>10.1f} MiB {elapsed:>8.1f}s'
+              f' ({os.path.getsize(compiled) / 2**20:.1f} MiB em disco)')
+        mapped.close()
+
+    print(f'{len(regra)} palavras distintas')
+
+def square_matrix_distance(word1, word2):
+    # Implementação anterior de levenshtein_distance, mantida para comparação
+    len1 = len(word1)
+    len2 = len(word2)
+
+    matrix_len = max(len1, len2) + 1
+    matrix = [[0 for _ in range(matrix_len)] for _ in range(matrix_len)]
+
+    for i in range(matrix_len):
+        matrix[i][0] = i
+        matrix[0][i] = i
+
+    for i in range(1, matrix_len):
+        for j in range(1, matrix_len):
+            matrix[i][j] = min(matrix[i - 1][j], matrix[i]
+                               [j - 1], matrix[i - 1][j - 1])
+
+            if i > len1:
+                matrix[i][j] += 1
+            elif j > len2:
+                matrix[i][j] += 1
+            elif word1[i - 1] != word2[j - 1]:
+                matrix[i][j] += 1
+
+    return matrix[matrix_len - 1][matrix_len - 1]
+
+
+def sample_words(path: str, n: int, seed: int = 42) -> list[str]:
+    words = sorted({word for word, _ in read_lexicon(path)})
+    return random.Random(seed).sample(words, min(n, len(words)))
+
+
+def levenshtein(path: str, pairs: str = '20000'):
+    # Custo por par de palavras de cada forma de calcular a distância
+    words = sample_words(path, 2 * int(pairs))
+    pairs = list(zip(words[::2], words[1::2]))
+
+    variants = [
+        ('matriz quadrada', square_matrix_distance),
+        ('duas linhas', levenshtein_distance),
+        ('faixa k=2', lambda a, b: levenshtein_distance(a, b, 2)),
+        ('faixa k=2 + transp.', lambda a, b: levenshtein_distance(a, b, 2, True)),
+    ]
+
+    for name, distance in variants:
+        start = time.perf_counter()
+        for a, b in pairs:
+            distance(a, b)
+        elapsed = time.perf_counter() - start
+
+        print(f'{name:<20} {elapsed / len(pairs) * 1e6:>8.2f} us/par')
+
+
+def lote(path: str, queries: str = '200'):
+    # Ordenação dos candidatos de __get_corrections__: um par por vez ou em lote
+    words = sorted({word for word, _ in read_lexicon(path)})
+    rng = random.Random(42)
+    queries = int(queries)
+
+    for size in (10, 100, 1000):
+        scalar = batch = 0.0
+
+        for word in rng.sample(words, queries):
+            candidates = rng.sample(words, size)
+
+            start = time.perf_counter()
+            expected = [levenshtein_distance(word, c) for c in candidates]
+            scalar += time.perf_counter() - start
+
+            start = time.perf_counter()
+            assert batch_levenshtein(word, candidates) == expected
+            batch += time.perf_counter() - start
+
+        print(f'{size:>5} candidatos: {scalar / queries * 1e3:>8.2f} ms um a um,'
+              f' {batch / queries * 1e3:>8.2f} ms em lote')
+
+
+def misspell(word: str, rng: random.Random) -> str:
+    # Uma substituição, remoção, inserção ou troca de letras vizinhas
+    i = rng.randrange(len(word))
+    letter = rng.choice('abcdefghijlmnopqrstuvxzçãáéíóõ')
+
+    return rng.choice([
+        word[:i] + letter + word[i + 1:],
+        word[:i] + word[i + 1:],
+        word[:i] + letter + word[i:],
+        word[:i] + word[i + 1:i + 2] + word[i] + word[i + 2:],
+    ])
+
+
+def delecoes(path: str, queries: str = '500'):
+    # Custo do DeleteIndex: construção, memória, tamanho em disco e consulta
+    dictionary = ReGra()
+    dictionary.extend(read_lexicon(path))
+
+    index, memory, elapsed = measure(lambda: DeleteIndex(dictionary.words()))
+    print(f'construção: {elapsed:.1f}s, {memory / 2**20:.1f} MiB,'
+          f' {len(index.deletes)} variantes para {len(index.words)} palavras')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        saved = os.path.join(tmp, 'dicionario.del')
+        index.save(saved)
+
+        start = time.perf_counter()
+        DeleteIndex.load(saved)
+        print(f'arquivo: {os.path.getsize(saved) / 2**20:.1f} MiB,'
+              f' carregado em {time.perf_counter() - start:.2f}s')
+
+    rng = random.Random(42)
+    words = rng.sample(index.words, int(queries))
+    typos = [misspell(word, rng) for word in words if len(word) > 1]
+
+    for name, lookup in [('DeleteIndex', index.lookup), ('ReGra.search', dictionary.search)]:
+        start = time.perf_counter()
+        for typo in typos:
+            lookup(typo, 2)
+
+        print(f'{name:<14} {(time.perf_counter() - start) / len(typos) * 1e3:>8.2f} ms/consulta')
+
+
+def typos_from(path: str, words: list[str], count: int) -> list[str]:
+    # Um arquivo com um erro por linha ou, sem ele, erros gerados ao acaso
+    if path:
+        with open(path) as f:
+            return [line.strip().lower() for line in f if line.strip()][:count]
+
+    rng = random.Random(42)
+    return [misspell(word, rng) for word in rng.sample(words, count) if len(word) > 1]
+
+
+def bktree(path: str, queries: str = '200', typos_path: str = ''):
+    # Árvore BK contra a busca por prefixo de __get_corrections__
+    dictionary = ReGra()
+    dictionary.extend(read_lexicon(path))
+    corretor = Corretor(dictionary=dictionary)
+
+    start = time.perf_counter()
+    tree = BKTree(dictionary.words())
+    print(f'construção da BKTree: {time.perf_counter() - start:.1f}s')
+
+    typos = [t for t in typos_from(typos_path, list(dictionary.words()), int(queries))
+             if dictionary.get_parent(t) is not None]
+
+    for k in (1, 2):
+        visited = 0
+        start = time.perf_counter()
+        for typo in typos:
+            tree.query(typo, k)
+            visited += tree.visited
+        elapsed = time.perf_counter() - start
+
+        print(f'BKTree k={k}: {visited / len(typos):>9.0f} nós/consulta,'
+              f' {elapsed / len(typos) * 1e3:>8.2f} ms/consulta')
+
+    visited = sum(len(corretor.__prefix_candidates__(typo)) for typo in typos)
+
+    start = time.perf_counter()
+    for typo in typos:
+        corretor.__get_corrections__(typo, 'ANY')
+    elapsed = time.perf_counter() - start
+
+    print(f'prefixo:  {visited / len(typos):>9.0f} candidatos/consulta,'
+          f' {elapsed / len(typos) * 1e3:>8.2f} ms/consulta')
+
+
+def sentences_from(path: str, words: list[str], count: int) -> list[str]:
+    # Um arquivo com uma frase por linha ou, sem ele, frases sorteadas
+    if path:
+        with open(path) as f:
+            return [line.strip() for line in f if line.strip()][:count]
+
+    rng = random.Random(42)
+    return [' '.join(rng.sample(words, rng.randint(5, 20))) for _ in range(count)]
+
+
+def etiquetador(path: str, sentences: str = '200', key: str = '', text_path: str = ''):
+    # Latência e vazão do etiquetador local e, com uma chave, do LX-Parser
+    dictionary = ReGra()
+    dictionary.extend(read_lexicon(path))
+    texts = sentences_from(text_path, list(dictionary.words()), int(sentences))
+
+    start = time.perf_counter()
+    tagger = LexiconTagger(dictionary)
+    print(f'construção do LexiconTagger: {time.perf_counter() - start:.1f}s')
+
+    backends = [('local', tagger.tag)]
+    if key:
+        corretor = Corretor(dictionary=dictionary, key=key)
+        backends.append(('LX-Parser', corretor.__lxparse__))
+
+    for name, tag in backends:
+        latencies = []
+        for text in texts:
+            start = time.perf_counter()
+            tag(text)
+            latencies.append(time.perf_counter() - start)
+
+        latencies.sort()
+        print(f'{name:<10} p50 {latencies[len(latencies) // 2] * 1e3:>8.2f} ms,'
+              f' p95 {latencies[int(len(latencies) * 0.95)] * 1e3:>8.2f} ms,'
+              f' {len(texts) / sum(latencies):>8.1f} frases/s')
+
+
+def acentos(path: str, queries: str = '500'):
+    # Palavras acentuadas escritas sem acento: índice sem acentos x busca aproximada
+    dictionary = ReGra()
+    dictionary.extend(read_lexicon(path))
+
+    index, memory, elapsed = measure(lambda: FoldedIndex(dictionary.words()))
+    print(f'construção: {elapsed:.1f}s, {memory / 2**20:.1f} MiB, {len(index.forms)} formas')
+
+    accented = [word for word in dictionary.words() if fold(word) != word.lower()]
+    rng = random.Random(42)
+    typos = [fold(word) for word in rng.sample(accented, min(int(queries), len(accented)))]
+
+    for name, folded in [('sem acentos', index), ('aproximada', None)]:
+        corretor = Corretor(dictionary=dictionary, cache_size=0)
+        corretor.setup_folded_index(folded)
+
+        start = time.perf_counter()
+        for typo in typos:
+            corretor.__get_corrections__(typo, 'ANY')
+        elapsed = time.perf_counter() - start
+
+        print(f'{name:<12} {elapsed / len(typos) * 1e3:>8.3f} ms/consulta')
+
+    print(f'acertos do índice: {index.stats()["hit_ratio"]:.1%}')
+
+
+def trie_lookup(dictionary: ReGra, word: str):
+    # Consulta anterior: desce a árvore um caractere por vez
+    node = dictionary.get_parent(word)
+    return node.data if node is not None and node.head == word else None
+
+
+def consultas(path: str, sentences: str = '2000', text_path: str = ''):
+    # Consultas exatas por segundo sobre os tokens de um corpus
+    dictionary = ReGra()
+    dictionary.extend(read_lexicon(path))
+
+    words = list(dictionary.words())
+    tokens = [token.lower() for sentence in sentences_from(text_path, words, int(sentences))
+              for token in sentence.split()]
+
+    for name, lookup in [('árvore', lambda word: trie_lookup(dictionary, word)),
+                         ('tabela', dictionary.__getitem__),
+                         ('in', dictionary.__contains__)]:
+        start = time.perf_counter()
+        for token in tokens:
+            lookup(token)
+        elapsed = time.perf_counter() - start
+
+        print(f'{name:<8} {len(tokens) / elapsed:>12.0f} consultas/s')
+
+
+def autocompletar(path: str, queries: str = '2000', k: str = '8'):
+    # Custo das listas de melhores completações e latência das sugestões
+    dictionary = ReGra()
+    dictionary.extend(read_lexicon(path))
+
+    _, memory, elapsed = measure(lambda: dictionary.build_completions(int(k)))
+    print(f'construção: {elapsed:.1f}s, {memory / 2**20:.1f} MiB')
+
+    rng = random.Random(42)
+    prefixes = [word[:rng.randint(1, len(word))] for word in sample_words(path, int(queries))]
+
+    for name, suggest in [('autocomplete', lambda prefix: dictionary.autocomplete(prefix, int(k))),
+                          ('iter_prefix', lambda prefix: list(islice(dictionary.iter_prefix(prefix), int(k))))]:
+        start = time.perf_counter()
+        for prefix in prefixes:
+            suggest(prefix)
+        elapsed = time.perf_counter() - start
+
+        print(f'{name:<14} {elapsed / len(prefixes) * 1e3:>8.3f} ms/consulta')
+
+
+def fresh_lexicon(path: str):
+    # Leitor anterior: conjuntos novos para cada linha do TSV
+    with open(path, encoding='utf-8') as dic:
+        for row in csv.reader(dic, delimiter='\t', quotechar='"'):
+            features = {x for x in row[3].split('|') if x}
+            yield row[0], WordData(raiz={row[1]}, tag={row[2]}, features=features,
+                                   mask=features_mask(features))
+
+
+def resident() -> int:
+    # RSS atual em bytes (Linux); fora dele, o pico informado pelo sistema
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def resident_after(loader, path: str) -> tuple[int, float]:
+    before = resident()
+    start = time.perf_counter()
+    dictionary = ReGra()
+    dictionary.extend(loader(path))
+    elapsed = time.perf_counter() - start
+
+    return resident() - before, elapsed
+
+
+def rss(path: str):
+    # Cada leitura roda em um processo novo para que uma não infle a outra
+    context = multiprocessing.get_context('fork' if os.name == 'posix' else 'spawn')
+    for name, loader in [('antes', fresh_lexicon), ('depois', read_lexicon)]:
+        with context.Pool(1) as pool:
+            memory, elapsed = pool.apply(resident_after, (loader, path))
+
+        print(f'{name:<8} {memory / 2**20:>10.1f} MiB RSS {elapsed:>8.1f}s')
+
+
+def first_correction(path: str, typo: str) -> tuple[Corretor, float]:
+    start = time.perf_counter()
+    corretor = Corretor(path, cache_size=0)
+    corretor.__get_corrections__(typo, 'ANY')
+
+    return corretor, time.perf_counter() - start
+
+
+def shards(path: str, word: str = 'caza'):
+    # Tempo até a primeira correção: léxico inteiro x shards sob demanda
+    with tempfile.TemporaryDirectory() as out_dir:
+        write_shards(path, out_dir)
+
+        _, elapsed = first_correction(path, word)
+        print(f'{"inteiro":<8} {elapsed:>8.2f}s')
+
+        corretor, elapsed = first_correction(out_dir, word)
+        dictionary = corretor.dictionary
+        print(f'{"shards":<8} {elapsed:>8.2f}s, {len(dictionary.shards)}/{len(dictionary.index)} shards carregados')
+
+        start = time.perf_counter()
+        dictionary.prefetch().join()
+        print(f'{"restante":<8} {time.perf_counter() - start:>8.2f}s em segundo plano')
+
+
+if __name__ == '__main__':
+    # python benchmarks.py memoria portilexicon-ud.tsv
+    benchmarks = {
+        'memoria': memoria,
+        'levenshtein': levenshtein,
+        'lote': lote,
+        'delecoes': delecoes,
+        'bktree': bktree,
+        'etiquetador': etiquetador,
+        'rss': rss,
+        'acentos': acentos,
+        'consultas': consultas,
+        'autocompletar': autocompletar,
+        'shards': shards,
+    }
+
+    benchmarks[sys.argv[1]](*sys.argv[2:])
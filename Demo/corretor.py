@@ -1,9 +1,43 @@
+import asyncio
 import csv
-from typing import TypedDict
+import gc
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import multiprocessing
+import os
+import pickle
+import random
+import re
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import unicodedata
+from abc import ABC, abstractmethod
+from array import array
+from collections import Counter, OrderedDict, deque
+from itertools import chain, islice
+from concurrent.futures import ThreadPoolExecutor
+from typing import NotRequired, TypedDict
 import requests
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
 from nltk import Tree
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
 lxparse_symbols = {
     'A': ['ADJ'],
     'ART': ['DET', 'PRON'],
@@ -16,10 +50,319 @@ lxparse_symbols = {
     'PRS': ['PRON'],
 }
 
+LXPARSER_WS_API_URL = 'https://portulanclarin.net/workbench/lx-parser/api/'
+
+# Tamanho máximo de texto aceito pelo LX-Parser em uma requisição
+LXPARSER_MAX_CHARS = 2000
+
+# Respostas HTTP que indicam falha passageira do serviço
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
 class WordData(TypedDict):
-    raiz: set[str]
-    tag: set[str]
-    features: set[str]
+    raiz: frozenset[str]
+    tag: frozenset[str]
+    features: frozenset[str]
+    mask: NotRequired[int]
+
+
+# Cada par 'Nome=Valor' e cada etiqueta recebem um bit na primeira vez em
+# que são vistos
+FEATURE_BITS: dict[str, int] = {}
+TAG_BITS: dict[str, int] = {}
+BITS_LOCK = threading.Lock()
+
+
+def bits_mask(table: dict[str, int], values) -> int:
+    mask = 0
+    for x in values:
+        bit = table.get(x)
+        if bit is None:
+            with BITS_LOCK:
+                bit = table.setdefault(x, 1 << len(table))
+        mask |= bit
+
+    return mask
+
+
+def features_mask(features) -> int:
+    return bits_mask(FEATURE_BITS, (x for x in features if x != '_'))
+
+
+def tags_mask(tags) -> int:
+    return bits_mask(TAG_BITS, tags)
+
+
+def entry_mask(data: WordData) -> int:
+    mask = data.get('mask')
+    if mask is None:
+        mask = data['mask'] = features_mask(data['features'])
+
+    return mask
+
+
+# Conjuntos iguais são compartilhados entre todas as entradas que os usam
+BUNDLES: dict[frozenset[str], frozenset[str]] = {}
+
+
+def share(values) -> frozenset[str]:
+    values = frozenset(sys.intern(x) for x in values)
+    return BUNDLES.setdefault(values, values)
+
+
+def merge_word_data(data: WordData, value: WordData):
+    for field in PAYLOAD_FIELDS:
+        if not value[field] <= data[field]:
+            data[field] = share(data[field] | value[field])
+    data['mask'] = entry_mask(data) | entry_mask(value)
+
+
+class BaseReGra(ABC):
+    '''
+    Consultas comuns a todas as representações do léxico.
+
+    As subclasses descrevem a árvore por root (a raiz), node_children (pares
+    (rótulo da aresta, nó)), node_data e get_parent, além de root_view (a
+    posição devolvida por find('')), view_node (o nó de uma posição, chave das
+    completações) e iter_entries, que cada uma percorre do seu jeito.
+    '''
+
+    @abstractmethod
+    def root(self):
+        ...
+
+    @abstractmethod
+    def node_children(self, node):
+        ...
+
+    @abstractmethod
+    def node_data(self, node) -> WordData | None:
+        ...
+
+    @abstractmethod
+    def get_parent(self, word: str):
+        ...
+
+    @abstractmethod
+    def __getitem__(self, word: str):
+        ...
+
+    @abstractmethod
+    def root_view(self):
+        ...
+
+    @abstractmethod
+    def view_node(self, view):
+        ...
+
+    @abstractmethod
+    def iter_entries(self, current, max_depth: float = 10, tag: str | None = None):
+        ...
+
+    def node_final(self, node) -> bool:
+        return self.node_data(node) is not None
+
+    def node_tags(self, node) -> int:
+        return node_tags(self.node_data(node))
+
+    def tag_bit(self, tag: str) -> int:
+        # Bit da etiqueta nas máscaras devolvidas por subtree_tags
+        return tags_mask((tag,))
+
+    def __contains__(self, word: str) -> bool:
+        return self[word] is not None
+
+    def __repr__(self) -> str:
+        string = ''
+        for label, node in self.node_children(self.root()):
+            string += self.build_tree(node, 0, label)
+
+        return string
+
+    def build_tree(self, current, depth: int = 0, head: str = ''):
+        string = f"{'-' * depth} {head}{' OK' if self.node_final(current) else ''}\n"
+
+        for label, node in self.node_children(current):
+            string += self.build_tree(node, depth + 1, head + label)
+
+        return string
+
+    def build_summaries(self):
+        # Etiquetas presentes abaixo de cada nó, calculadas na primeira consulta
+        if self.summaries is None:
+            self.summaries = tag_summaries([child for _, child in self.node_children(self.root())],
+                                           lambda node: [child for _, child in self.node_children(node)],
+                                           self.node_tags)
+
+    def subtree_tags(self, node) -> int:
+        self.build_summaries()
+        return self.summaries[node]
+
+    def find(self, prefix: str):
+        # Posição cujo head é exatamente prefix; '' devolve a raiz
+        if not prefix:
+            return self.root_view()
+
+        view = self.get_parent(prefix)
+        return view if view is not None and view.head == prefix else None
+
+    def iter_prefix(self, prefix: str, max_depth: float = math.inf):
+        view = self.find(prefix)
+        if view is None:
+            return
+
+        if view.data is not None:
+            yield view.head
+
+        for head, _ in self.iter_entries(view, max_depth):
+            yield head
+
+    def items(self):
+        return self.iter_entries(self.find(''), math.inf)
+
+    def get_entries(self, current, max_depth: int = 10, depth: int = 0,
+                    tag: str | None = None) -> list[tuple[str, WordData]]:
+        return list(self.iter_entries(current, max_depth - depth, tag))
+
+    def get_children(self, current, max_depth: int = 10, depth: int = 0) -> list[str]:
+        return [head for head, _ in self.iter_entries(current, max_depth - depth)]
+
+    def build_completions(self, k: int = 10, key=None):
+        self.completions = top_completions(self.node_children(self.root()), self.node_children,
+                                           self.node_final, k, key)
+        self.completions_k = k
+
+    def autocomplete(self, prefix: str, k: int = 10) -> list[str]:
+        if self.completions is None or self.completions_k < k:
+            self.build_completions(max(k, self.completions_k))
+
+        view = self.find(prefix)
+        if view is None:
+            return []
+
+        return list(self.completions[self.view_node(view) if prefix else None][:k])
+
+    def search(self, word: str, max_distance: int = 2, transpositions: bool = False,
+               tag: str | None = None) -> list[tuple[str, int]]:
+        return bounded_search(word, max_distance, self.node_children(self.root()), self.node_children,
+                              *tag_filter(tag, self.node_data, self.subtree_tags, self.tag_bit),
+                              transpositions=transpositions)
+
+    def compile(self, path: str):
+        # Serializa a árvore num arquivo binário que pode ser mapeado em memória
+        # por MappedReGra. Os nós são gravados em largura (BFS), de forma que os
+        # filhos de cada nó ficam contíguos e ordenados pelo caractere (arestas
+        # com vários caracteres viram uma cadeia de nós). Cada nó
+        # leva também as etiquetas presentes na sua subárvore, em bits próprios
+        # do arquivo (a ordem da tabela de etiquetas), e cada payload a máscara
+        # das suas features, nos bits de FEATURE_BITS (a tabela de features
+        # guarda a ordem deles).
+        strings: dict[str, int] = {}
+        tags: dict[str, int] = {}
+        payloads: dict[tuple, int] = {}
+        payload_words: list[int] = []
+        payload_index: list[int] = [0]
+        payload_masks: list[int] = []
+
+        def string_id(value: str):
+            if value not in strings:
+                strings[value] = len(strings)
+            return strings[value]
+
+        def payload_id(data: WordData | None):
+            if data is None:
+                return -1
+
+            key = tuple(tuple(sorted(data[field])) for field in PAYLOAD_FIELDS)
+            if key not in payloads:
+                payloads[key] = len(payloads)
+                for values in key:
+                    payload_words.append(len(values))
+                    payload_words.extend(string_id(v) for v in values)
+                payload_index.append(len(payload_words))
+                payload_masks.append(entry_mask(data))
+
+            return payloads[key]
+
+        def tag_mask(data: WordData | None):
+            mask = 0
+            for tag in () if data is None else data['tag']:
+                if tag not in tags:
+                    if len(tags) == 64:
+                        raise ValueError('compiled ReGra files support at most 64 tags')
+
+                    tags[tag] = len(tags)
+                mask |= 1 << tags[tag]
+
+            return mask
+
+        def children(node):
+            return sorted(self.node_children(node), key=lambda edge: edge[0])
+
+        def entry(label: str, node):
+            if len(label) > 1:
+                return ord(label[0]), None, [(label[1:], node)]
+
+            return ord(label), self.node_data(node), children(node)
+
+        records = []
+        level = [(0, None, children(self.root()))]
+        next_index = 1
+        while level:
+            next_level = []
+            for char, data, edges in level:
+                records.append([char, payload_id(data), next_index, len(edges), tag_mask(data)])
+                next_index += len(edges)
+
+                for label, node in edges:
+                    next_level.append(entry(label, node))
+            level = next_level
+
+        # Em BFS os filhos vêm depois do pai: de trás para frente, cada nó já
+        # encontra as etiquetas dos filhos completas
+        for record in reversed(records):
+            for i in range(record[2], record[2] + record[3]):
+                record[4] |= records[i][4]
+
+        words = sum(1 for record in records if record[1] >= 0)
+        tag_list = [string_id(tag) for tag in tags]
+        # Os bits são dados na ordem em que as features são vistas, então a
+        # tabela é o começo de FEATURE_BITS até o maior bit usado
+        width = max(payload_masks, default=0).bit_length()
+        with BITS_LOCK:
+            feature_list = [string_id(feature) for feature in list(FEATURE_BITS)[:width]]
+        mask_size = (len(feature_list) + 63) // 64 * 8
+
+        blob = bytearray()
+        string_index = [0]
+        for value in strings:
+            blob += value.encode('utf-8')
+            string_index.append(len(blob))
+
+        nodes_offset = _HEADER.size
+        payload_index_offset = nodes_offset + len(records) * _NODE.size
+        payload_words_offset = payload_index_offset + len(payload_index) * 4
+        payload_masks_offset = payload_words_offset + len(payload_words) * 4
+        string_index_offset = payload_masks_offset + len(payload_masks) * mask_size
+        tag_list_offset = string_index_offset + len(string_index) * 4
+        feature_list_offset = tag_list_offset + len(tag_list) * 4
+        blob_offset = feature_list_offset + len(feature_list) * 4
+
+        with open(path, 'wb') as out:
+            out.write(_HEADER.pack(REGRA_MAGIC, len(records), len(payloads), len(strings),
+                                   payload_index_offset, payload_words_offset,
+                                   string_index_offset, blob_offset,
+                                   words, len(tag_list), tag_list_offset,
+                                   len(feature_list), feature_list_offset, payload_masks_offset))
+            for record in records:
+                out.write(_NODE.pack(*record))
+            out.write(struct.pack(f'<{len(payload_index)}I', *payload_index))
+            out.write(struct.pack(f'<{len(payload_words)}I', *payload_words))
+            for mask in payload_masks:
+                out.write(mask.to_bytes(mask_size, 'little'))
+            out.write(struct.pack(f'<{len(string_index)}I', *string_index))
+            out.write(struct.pack(f'<{len(tag_list)}I', *tag_list))
+            out.write(struct.pack(f'<{len(feature_list)}I', *feature_list))
+            out.write(blob)
 
 
 class Node():
@@ -29,142 +372,1814 @@ class Node():
         self.prox = {} if prox is None else prox
 
 
-class ReGra():
+class ReGra(BaseReGra):
     def __init__(self):
         self.nodes: dict[str, Node] = {}
+        self.summaries: dict[Node, int] | None = None
+        self.completions: dict[Node, tuple[str, ...]] | None = None
+        self.completions_k = 0
+
+        # Consultas exatas vão direto a esta tabela; a árvore fica para as
+        # buscas por prefixo e aproximadas. As chaves são os próprios heads.
+        self.entries: dict[str, WordData] = {}
 
     def dive(self, current_node: Node, word: str, depth: int):
-        # Palavra não existe ou palavra encontrada
-        if depth >= len(word) or word[depth] not in current_node.prox.keys():
-            return current_node
+        # Desce até a palavra não existir ou ser encontrada
+        while depth < len(word) and word[depth] in current_node.prox:
+            current_node = current_node.prox[word[depth]]
+            depth += 1
 
-        # Continua a recursão
-        return self.dive(current_node.prox[word[depth]], word, depth + 1)
+        return current_node
 
     def get_parent(self, word: str) -> Node | None:
         if word[0] not in self.nodes.keys():
             return None
 
-        return self.dive(self.nodes[word[0]], word, 1)
+        return self.dive(self.nodes[word[0]], word, 1)
+
+    def root(self) -> Node:
+        return Node(head='', prox=self.nodes)
+
+    def node_children(self, node: Node):
+        return node.prox.items()
+
+    def node_data(self, node: Node) -> WordData | None:
+        return node.data
+
+    def root_view(self) -> Node:
+        return self.root()
+
+    def view_node(self, view: Node) -> Node:
+        return view
+
+    def __getitem__(self, word: str):
+        return self.entries.get(word)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __setitem__(self, idx: str, value: WordData):
+        self.summaries = None
+        self.completions = None
+        parent = self.get_parent(idx)
+
+        # Se o conjunto está vazio ou uma letra base não existe
+        if parent is None:
+            if len(idx) == 1:
+                self.nodes[idx] = Node(head=idx, data=value)
+                self.entries[idx] = value
+                return
+
+            parent = Node(head=idx[0])
+            self.nodes[idx[0]] = parent
+
+            for i in range(1, len(idx) - 1):
+                parent.prox[idx[i]] = Node(head=idx[:i + 1])
+                parent = parent.prox[idx[i]]
+
+            parent.prox[idx[-1]] = Node(head=idx, data=value)
+            self.entries[idx] = value
+            return
+
+        # Se a palavra existe, atualiza os dados
+        if parent.head == idx:
+            self.merge(parent, value)
+            return
+
+        # Se a palavra não existe, mas é filha de uma que existe
+        # cria o nó dela
+        if len(parent.head) + 1 == len(idx):
+            parent.prox[idx[-1]] = Node(head=idx, data=value)
+
+        # Se a palavra não existe, e não é filha de uma que existe
+        # cria um caminho de nós até ela
+        else:
+            for i in range(len(parent.head), len(idx) - 1):
+                parent.prox[idx[i]] = Node(head=idx[:i + 1])
+                parent = parent.prox[idx[i]]
+
+            parent.prox[idx[-1]] = Node(head=idx, data=value)
+
+        self.entries[idx] = value
+
+    def merge(self, node: Node, value: WordData):
+        if node.data is None:
+            node.data = value
+            self.entries[node.head] = value
+
+        else:
+            merge_word_data(node.data, value)
+
+    def extend(self, rows) -> int:
+        # Os nós não formam ciclos; pausar o coletor evita varreduras completas
+        # do heap a cada poucos milhares de nós criados
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        self.summaries = None
+        self.completions = None
+
+        try:
+            return self.__extend__(rows)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    def __extend__(self, rows) -> int:
+        # Insere as palavras reaproveitando o caminho em comum com a palavra
+        # anterior em vez de descer a partir da raiz. Com a entrada ordenada,
+        # cada nó é visitado uma única vez durante toda a carga.
+        path: list[Node] = []
+        previous = ''
+        count = 0
+
+        for word, value in rows:
+            if not word:
+                continue
+
+            common = 0
+            limit = min(len(word), len(previous))
+            while common < limit and word[common] == previous[common]:
+                common += 1
+
+            del path[common:]
+            prox = self.nodes if common == 0 else path[-1].prox
+
+            # Desce pelos nós que já existem...
+            i = common
+            while i < len(word) and word[i] in prox:
+                path.append(prox[word[i]])
+                prox = path[-1].prox
+                i += 1
+
+            # ...e cria o restante do caminho
+            for i in range(i, len(word)):
+                path.append(Node(head=word[:i + 1]))
+                prox[word[i]] = path[-1]
+                prox = path[-1].prox
+
+            self.merge(path[-1], value)
+            previous = word
+            count += 1
+
+        return count
+
+    def iter_entries(self, current: Node, max_depth: float = 10, tag: str | None = None):
+        # Pares (palavra, dados) abaixo de current com até max_depth caracteres a
+        # mais, em pré-ordem e sob demanda, sem montar listas pelo caminho
+        bit = None if tag is None else self.tag_bit(tag)
+        if max_depth < 1:
+            return
+
+        # Um iterador de filhos por nível; a profundidade é o tamanho da pilha
+        stack = [iter(current.prox.values())]
+        while stack:
+            for node in stack[-1]:
+                # Ramos sem nenhuma palavra com a etiqueta são descartados
+                if bit is not None and not self.subtree_tags(node) & bit:
+                    continue
+
+                if node.data is not None and (tag is None or tag in node.data['tag']):
+                    yield node.head, node.data
+
+                if len(stack) < max_depth and node.prox:
+                    stack.append(iter(node.prox.values()))
+                    break
+            else:
+                stack.pop()
+
+    def words(self):
+        stack = list(reversed(self.nodes.values()))
+        while stack:
+            node = stack.pop()
+            if node.data is not None:
+                yield node.head
+
+            stack.extend(reversed(node.prox.values()))
+
+
+PAYLOAD_FIELDS = ('raiz', 'tag', 'features')
+
+REGRA_MAGIC = b'REGRA\x00\x00\x03'
+
+# magic, nós, payloads, strings, o offset de cada seção, palavras, as tabelas
+# de etiquetas e de features (quantidade e offset) e o offset das máscaras de
+# features dos payloads
+_HEADER = struct.Struct('<8sIIIIIIIIIIIII')
+
+# caractere, payload (-1 se não for palavra), primeiro filho, quantidade de
+# filhos e as etiquetas da subárvore
+_NODE = struct.Struct('<IiIIQ')
+
+
+def read_lexicon(path: str, progress: tqdm | None = None):
+    # Lê o TSV uma única vez; o progresso é medido pelos bytes consumidos
+    def lines(file):
+        for line in file:
+            if progress is not None:
+                progress.update(len(line))
+
+            yield line.decode('utf-8')
+
+    # Células repetidas reaproveitam o mesmo frozenset (e a mesma máscara)
+    singles: dict[str, frozenset[str]] = {}
+    bundles: dict[str, tuple[frozenset[str], int]] = {}
+
+    def single(value: str) -> frozenset[str]:
+        shared = singles.get(value)
+        if shared is None:
+            shared = singles[value] = share((value,))
+
+        return shared
+
+    with open(path, 'rb') as dic:
+        for row in csv.reader(lines(dic), delimiter='\t', quotechar='"'):
+            word = row[0]
+            features = bundles.get(row[3])
+            if features is None:
+                shared = share(x for x in row[3].split('|') if x)
+                features = bundles[row[3]] = (shared, features_mask(shared))
+
+            yield word, WordData(raiz=single(row[1]), tag=single(row[2]),
+                                 features=features[0], mask=features[1])
+
+
+def is_compiled(path: str) -> bool:
+    # Só o prefixo: um arquivo de outra versão é recusado por MappedReGra
+    with open(path, 'rb') as f:
+        return f.read(len(REGRA_MAGIC) - 2) == REGRA_MAGIC[:-2]
+
+
+class NodeView():
+    # Nó de uma árvore armazenada em vetores. O prefixo (head) é montado durante
+    # a descida e os dados são lidos da árvore apenas quando acessados.
+    __slots__ = ('head', 'index', 'regra')
+
+    def __init__(self, head: str, index: int, regra: 'IndexedReGra'):
+        self.head = head
+        self.index = index
+        self.regra = regra
+
+    @property
+    def data(self) -> WordData | None:
+        return self.regra.node_data(self.index)
+
+    @property
+    def prox(self) -> dict[str, 'NodeView']:
+        return {char: NodeView(self.head + char, i, self.regra)
+                for char, i in self.regra.node_children(self.index)}
+
+
+class IndexedReGra(BaseReGra):
+    '''
+    Consultas comuns às árvores em que cada nó é um índice inteiro e o nó 0 é
+    a raiz. As subclasses implementam child, node_children e node_data.
+    '''
+
+    @abstractmethod
+    def child(self, index: int, char: str) -> int | None:
+        ...
+
+    @abstractmethod
+    def node_children(self, index: int):
+        ...
+
+    @abstractmethod
+    def node_data(self, index: int) -> WordData | None:
+        ...
+
+    def get_parent(self, word: str) -> NodeView | None:
+        index = self.child(0, word[0])
+        if index is None:
+            return None
+
+        depth = 1
+        while depth < len(word):
+            nxt = self.child(index, word[depth])
+            if nxt is None:
+                break
+
+            index = nxt
+            depth += 1
+
+        return NodeView(word[:depth], index, self)
+
+    def __getitem__(self, word: str):
+        node = self.get_parent(word)
+
+        if node is None or node.head != word:
+            return None
+
+        return node.data
+
+    @property
+    def nodes(self) -> dict[str, NodeView]:
+        return NodeView('', 0, self).prox
+
+    def root(self) -> int:
+        return 0
+
+    def root_view(self) -> NodeView:
+        return NodeView('', 0, self)
+
+    def view_node(self, view: NodeView) -> int:
+        return view.index
+
+    def iter_entries(self, current: NodeView, max_depth: float = 10, tag: str | None = None):
+        bit = None if tag is None else self.tag_bit(tag)
+        if max_depth < 1:
+            return
+
+        stack = [(current.head, self.node_children(current.index))]
+        while stack:
+            prefix, children = stack[-1]
+            for char, index in children:
+                if bit is not None and not self.subtree_tags(index) & bit:
+                    continue
+
+                head = prefix + char
+                data = self.node_data(index)
+                if data is not None and (tag is None or tag in data['tag']):
+                    yield head, data
+
+                if len(stack) < max_depth:
+                    stack.append((head, self.node_children(index)))
+                    break
+            else:
+                stack.pop()
+
+    def words(self):
+        stack = [('', 0)]
+        while stack:
+            head, index = stack.pop()
+            if index and self.node_data(index) is not None:
+                yield head
+
+            stack.extend(reversed([(head + char, i) for char, i in self.node_children(index)]))
+
+
+class ArrayReGra(IndexedReGra):
+    '''
+    ReGra com as transições guardadas em vetores planos de inteiros.
+
+    Cada nó é um índice; os filhos formam uma lista encadeada ordenada pelo
+    caractere (primeiro filho / próximo irmão). O prefixo de cada nó não é
+    armazenado e os dados das palavras ficam numa tabela à parte.
+    '''
+
+    def __init__(self):
+        self.char = array('I', [0])
+        self.first_child = array('i', [-1])
+        self.next_sibling = array('i', [-1])
+        self.payload = array('i', [-1])
+        self.data: list[WordData] = []
+        self.summaries: dict[int, int] | None = None
+        self.completions: dict[int, tuple[str, ...]] | None = None
+        self.completions_k = 0
+
+    def child(self, index: int, char: str) -> int | None:
+        target = ord(char)
+        i = self.first_child[index]
+
+        while i >= 0 and self.char[i] < target:
+            i = self.next_sibling[i]
+
+        if i >= 0 and self.char[i] == target:
+            return i
+
+        return None
+
+    def node_children(self, index: int):
+        i = self.first_child[index]
+
+        while i >= 0:
+            yield chr(self.char[i]), i
+            i = self.next_sibling[i]
+
+    def node_data(self, index: int) -> WordData | None:
+        idx = self.payload[index]
+        return None if idx < 0 else self.data[idx]
+
+    def __add_child__(self, index: int, char: str) -> int:
+        target = ord(char)
+        new = len(self.char)
+
+        self.char.append(target)
+        self.first_child.append(-1)
+        self.payload.append(-1)
+
+        # Mantém os irmãos ordenados pelo caractere
+        previous, i = -1, self.first_child[index]
+        while i >= 0 and self.char[i] < target:
+            previous, i = i, self.next_sibling[i]
+
+        self.next_sibling.append(i)
+        if previous < 0:
+            self.first_child[index] = new
+        else:
+            self.next_sibling[previous] = new
+
+        return new
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __setitem__(self, idx: str, value: WordData):
+        self.summaries = None
+        self.completions = None
+        index = 0
+        for char in idx:
+            nxt = self.child(index, char)
+            index = self.__add_child__(index, char) if nxt is None else nxt
+
+        if self.payload[index] < 0:
+            self.payload[index] = len(self.data)
+            self.data.append(value)
+        else:
+            merge_word_data(self.data[self.payload[index]], value)
+
+    def extend(self, rows) -> int:
+        count = 0
+        for word, value in rows:
+            if word:
+                self[word] = value
+                count += 1
+
+        return count
+
+
+class MappedReGra(IndexedReGra):
+    '''
+    Versão somente leitura de um ReGra gravado com ReGra.compile.
+
+    O arquivo é mapeado em memória e as consultas são feitas diretamente sobre
+    o buffer, sem construir os nós na carga. Como o mapeamento é somente leitura,
+    as páginas são compartilhadas entre os processos que abrem o mesmo arquivo.
+    '''
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.buffer[:len(REGRA_MAGIC)] != REGRA_MAGIC:
+            self.buffer.close()
+            raise ValueError(f'{path} is not a compiled ReGra file of this version')
+
+        (_, self.node_count, self.payload_count, self.string_count,
+         self.payload_index_offset, self.payload_words_offset,
+         self.string_index_offset, self.blob_offset,
+         self.size, tag_count, tag_list_offset,
+         feature_count, feature_list_offset, self.payload_masks_offset) = _HEADER.unpack_from(self.buffer, 0)
+
+        # Bit de cada etiqueta nas máscaras gravadas no arquivo
+        tag_list = struct.unpack_from(f'<{tag_count}I', self.buffer, tag_list_offset)
+        self.tag_bits = {self.string(idx): 1 << bit for bit, idx in enumerate(tag_list)}
+
+        # Bit em FEATURE_BITS de cada bit de feature do arquivo. As features
+        # são registradas na ordem da tabela; no processo que compilou, ou num
+        # que ainda não tinha outras, os bits coincidem e as máscaras são
+        # usadas como estão
+        feature_list = struct.unpack_from(f'<{feature_count}I', self.buffer, feature_list_offset)
+        self.feature_bits = [features_mask((self.string(idx),)) for idx in feature_list]
+        self.features_native = all(bit == 1 << i for i, bit in enumerate(self.feature_bits))
+        self.mask_size = (feature_count + 63) // 64 * 8
+
+        self.completions: dict[int, tuple[str, ...]] | None = None
+        self.completions_k = 0
+
+    def close(self):
+        self.buffer.close()
+
+    def record(self, index: int) -> tuple[int, int, int, int, int]:
+        return _NODE.unpack_from(self.buffer, _HEADER.size + index * _NODE.size)
+
+    def string(self, idx: int) -> str:
+        start, end = struct.unpack_from(
+            '<2I', self.buffer, self.string_index_offset + idx * 4)
+        return self.buffer[self.blob_offset + start:self.blob_offset + end].decode('utf-8')
+
+    def payload(self, idx: int) -> WordData | None:
+        if idx < 0:
+            return None
+
+        start, end = struct.unpack_from(
+            '<2I', self.buffer, self.payload_index_offset + idx * 4)
+        words = struct.unpack_from(
+            f'<{end - start}I', self.buffer, self.payload_words_offset + start * 4)
+
+        data, pos = {}, 0
+        for field in PAYLOAD_FIELDS:
+            count = words[pos]
+            data[field] = frozenset(self.string(x) for x in words[pos + 1:pos + 1 + count])
+            pos += count + 1
+
+        start = self.payload_masks_offset + idx * self.mask_size
+        mask = int.from_bytes(self.buffer[start:start + self.mask_size], 'little')
+        if not self.features_native:
+            mask = self.feature_mask(mask)
+
+        return WordData(**data, mask=mask)
+
+    def feature_mask(self, mask: int) -> int:
+        # Traduz uma máscara do arquivo para os bits de FEATURE_BITS
+        result = 0
+        while mask:
+            low = mask & -mask
+            result |= self.feature_bits[low.bit_length() - 1]
+            mask ^= low
+
+        return result
+
+    def node_data(self, index: int) -> WordData | None:
+        return self.payload(self.record(index)[1])
+
+    def node_children(self, index: int):
+        _, _, first, count, _ = self.record(index)
+
+        for i in range(first, first + count):
+            yield chr(self.record(i)[0]), i
+
+    def child(self, index: int, char: str) -> int | None:
+        # Busca binária entre os filhos, que estão ordenados pelo caractere
+        _, _, low, count, _ = self.record(index)
+        high = low + count - 1
+        target = ord(char)
+
+        while low <= high:
+            mid = (low + high) // 2
+            value = self.record(mid)[0]
+
+            if value == target:
+                return mid
+            if value < target:
+                low = mid + 1
+            else:
+                high = mid - 1
+
+        return None
+
+    def tag_bit(self, tag: str) -> int:
+        return self.tag_bits.get(tag, 0)
+
+    def build_summaries(self):
+        # Gravadas pelo compile; nada é calculado nem guardado no processo
+        pass
+
+    def subtree_tags(self, index: int) -> int:
+        return self.record(index)[4]
+
+    def node_final(self, index: int) -> bool:
+        return self.record(index)[1] >= 0
+
+    def iter_entries(self, current: NodeView, max_depth: float = 10, tag: str | None = None):
+        # Como em IndexedReGra, mas lendo cada registro uma única vez
+        bit = None if tag is None else self.tag_bit(tag)
+        if max_depth < 1:
+            return
+
+        _, _, first, count, _ = self.record(current.index)
+        stack = [(current.head, iter(range(first, first + count)))]
+        while stack:
+            prefix, children = stack[-1]
+            for i in children:
+                if bit is not None and not self.subtree_tags(i) & bit:
+                    continue
+
+                char, payload, first, count, _ = self.record(i)
+                head = prefix + chr(char)
+
+                if payload >= 0:
+                    data = self.payload(payload)
+                    if tag is None or tag in data['tag']:
+                        yield head, data
+
+                if len(stack) < max_depth and count:
+                    stack.append((head, iter(range(first, first + count))))
+                    break
+            else:
+                stack.pop()
+
+    def build_completions(self, k: int = 10, key=None):
+        # Na ordem padrão as sugestões saem de uma busca em largura a partir do
+        # prefixo (autocomplete), sem percorrer o arquivo nem guardar listas
+        if key is None:
+            self.completions = None
+            self.completions_k = k
+            return
+
+        super().build_completions(k, key)
+
+    def autocomplete(self, prefix: str, k: int = 10) -> list[str]:
+        if self.completions is not None:
+            return super().autocomplete(prefix, k)
+
+        view = self.find(prefix)
+        if view is None:
+            return []
+
+        # Os filhos estão ordenados pelo caractere, então nível a nível as
+        # palavras já aparecem na ordem de completion_rank: as k primeiras bastam
+        found = []
+        level = [(view.head, view.index)]
+        while level:
+            next_level = []
+            for head, index in level:
+                _, payload, first, count, _ = self.record(index)
+                if payload >= 0:
+                    found.append(head)
+                    if len(found) == k:
+                        return found
+
+                next_level.extend((head + chr(self.record(i)[0]), i) for i in range(first, first + count))
+            level = next_level
+
+        return found
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class RadixNode():
+    __slots__ = ('label', 'data', 'prox')
+
+    def __init__(self, label: str, data: WordData | None = None, prox: dict[str, 'RadixNode'] | None = None):
+        self.label = label
+        self.data = data
+        self.prox = {} if prox is None else prox
+
+
+class RadixView():
+    # Posição numa RadixReGra, que pode estar no meio do rótulo de uma aresta
+    __slots__ = ('head', 'node', 'offset')
+
+    def __init__(self, head: str, node: RadixNode, offset: int):
+        self.head = head
+        self.node = node
+        self.offset = offset
+
+    @property
+    def data(self) -> WordData | None:
+        return self.node.data if self.offset == len(self.node.label) else None
+
+
+class RadixReGra(BaseReGra):
+    '''
+    ReGra com compressão de caminhos: cadeias de nós com um único filho viram
+    uma só aresta, rotulada com todos os seus caracteres. As consultas descem
+    a árvore num laço, sem recursão.
+    '''
+
+    def __init__(self):
+        self.nodes: dict[str, RadixNode] = {}
+        self.summaries: dict[RadixNode, int] | None = None
+        self.completions: dict[RadixNode, tuple[str, ...]] | None = None
+        self.completions_k = 0
+        self.size = 0
+
+    def dive(self, word: str) -> RadixView | None:
+        node = self.nodes.get(word[0])
+        if node is None:
+            return None
+
+        depth = 0
+        while True:
+            # Consome o rótulo da aresta enquanto ele coincide com a palavra
+            label = node.label
+            offset = 0
+            while offset < len(label) and depth < len(word) and label[offset] == word[depth]:
+                offset += 1
+                depth += 1
+
+            if offset < len(label) or depth == len(word) or word[depth] not in node.prox:
+                return RadixView(word[:depth], node, offset)
+
+            node = node.prox[word[depth]]
+
+    def get_parent(self, word: str) -> RadixView | None:
+        return self.dive(word)
+
+    def root(self) -> RadixNode:
+        return RadixNode('', prox=self.nodes)
+
+    def node_children(self, node: RadixNode):
+        return [(child.label, child) for child in node.prox.values()]
+
+    def node_data(self, node: RadixNode) -> WordData | None:
+        return node.data
+
+    def root_view(self) -> RadixView:
+        return RadixView('', self.root(), 0)
+
+    def view_node(self, view: RadixView) -> RadixNode:
+        # No meio de uma aresta, todas as palavras abaixo dela começam com o prefixo
+        return view.node
+
+    def __getitem__(self, word: str):
+        view = self.dive(word)
+
+        if view is None or view.head != word:
+            return None
+
+        return view.data
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __setitem__(self, idx: str, value: WordData):
+        self.summaries = None
+        self.completions = None
+        view = self.dive(idx)
+
+        # Se uma letra base não existe, a palavra inteira vira uma aresta
+        if view is None:
+            self.nodes[idx[0]] = RadixNode(idx, data=value)
+            self.size += 1
+            return
+
+        node, offset, depth = view.node, view.offset, len(view.head)
+
+        # Se a descida parou no meio de uma aresta, divide a aresta
+        if offset < len(node.label):
+            rest = RadixNode(node.label[offset:], data=node.data, prox=node.prox)
+            node.label = node.label[:offset]
+            node.data = None
+            node.prox = {rest.label[0]: rest}
+
+        if depth == len(idx):
+            if node.data is None:
+                node.data = value
+                self.size += 1
+            else:
+                merge_word_data(node.data, value)
+        else:
+            node.prox[idx[depth]] = RadixNode(idx[depth:], data=value)
+            self.size += 1
+
+    def extend(self, rows) -> int:
+        count = 0
+        for word, value in rows:
+            if word:
+                self[word] = value
+                count += 1
+
+        return count
+
+    def iter_entries(self, current: RadixView, max_depth: float = 10, tag: str | None = None):
+        # Mesma semântica da ReGra: palavras com até max_depth caracteres a
+        # mais que a posição atual, sem incluir a própria posição
+        limit = len(current.head) + max_depth
+        bit = None if tag is None else self.tag_bit(tag)
+
+        stack = [(current.head[:len(current.head) - current.offset], current.node)]
+        while stack:
+            prefix, node = stack.pop()
+            if bit is not None and node.label and not self.subtree_tags(node) & bit:
+                continue
+
+            head = prefix + node.label
+            if (len(current.head) < len(head) <= limit and node.data is not None
+                    and (tag is None or tag in node.data['tag'])):
+                yield head, node.data
+
+            if len(head) < limit:
+                stack.extend((head, child) for child in reversed(node.prox.values()))
+
+    def words(self):
+        stack = [('', node) for node in reversed(self.nodes.values())]
+        while stack:
+            prefix, node = stack.pop()
+            head = prefix + node.label
+            if node.data is not None:
+                yield head
+
+            stack.extend((head, child) for child in reversed(node.prox.values()))
+
+
+SHARDS_INDEX = 'shards.json'
+
+
+def shard_key(word: str) -> str:
+    # Palavras que só diferem no acento da primeira letra ficam no mesmo shard
+    return fold(word[:1])[:1]
+
+
+def is_sharded(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, SHARDS_INDEX))
+
+
+def write_shards(path: str, out_dir: str) -> dict[str, dict]:
+    '''
+    Divide o TSV do léxico em um TSV por shard_key da palavra, dentro de
+    out_dir, com um índice (shards.json) do arquivo e do número de palavras
+    de cada shard. As linhas são copiadas sem alteração.
+    '''
+    os.makedirs(out_dir, exist_ok=True)
+    files, writers, words = {}, {}, {}
+
+    try:
+        with open(path, encoding='utf-8', newline='') as dic:
+            for row in csv.reader(dic, delimiter='\t', quotechar='"'):
+                if not row or not row[0]:
+                    continue
+
+                key = shard_key(row[0])
+                if key not in writers:
+                    name = f'shard-{len(files):03d}.tsv'
+                    files[key] = open(os.path.join(out_dir, name), 'w', encoding='utf-8', newline='')
+                    writers[key] = csv.writer(files[key], delimiter='\t', quotechar='"', lineterminator='\n')
+                    words[key] = set()
+
+                writers[key].writerow(row)
+                words[key].add(row[0])
+
+    finally:
+        for f in files.values():
+            f.close()
+
+    shards = {key: {'file': os.path.basename(f.name), 'words': len(words[key])}
+              for key, f in files.items()}
+
+    with open(os.path.join(out_dir, SHARDS_INDEX), 'w', encoding='utf-8') as out:
+        json.dump({'shards': shards}, out, ensure_ascii=False, indent=1)
+
+    return shards
+
+
+class ShardedReGra(BaseReGra):
+    '''
+    Léxico gravado por write_shards, carregado sob demanda.
+
+    Na abertura só o índice é lido. Cada shard vira uma ReGra na primeira
+    consulta a uma palavra com a sua primeira letra, então o primeiro pedido
+    paga apenas pelos shards que usa. Com prefetch, uma thread carrega os
+    demais em segundo plano. Consultas que percorrem o léxico inteiro (words,
+    search, a raiz vazia) carregam todos os shards.
+    '''
+
+    def __init__(self, path: str, prefetch: bool = False):
+        self.path = path
+        with open(os.path.join(path, SHARDS_INDEX), encoding='utf-8') as f:
+            self.index: dict[str, dict] = json.load(f)['shards']
+
+        self.shards: dict[str, ReGra] = {}
+        self.folded_indexes: dict[str, FoldedIndex] = {}
+        self.locks = {key: threading.Lock() for key in self.index}
+        self.load_seconds: dict[str, float] = {}
+        self.prefetcher: threading.Thread | None = None
+
+        if prefetch:
+            self.prefetch()
+
+    def load(self, key: str) -> ReGra | None:
+        shard = self.shards.get(key)
+        if shard is not None or key not in self.index:
+            return shard
+
+        with self.locks[key]:
+            if key not in self.shards:
+                start = time.perf_counter()
+                shard = ReGra()
+                shard.extend(read_lexicon(os.path.join(self.path, self.index[key]['file'])))
+                self.shards[key] = shard
+                self.load_seconds[key] = time.perf_counter() - start
+
+        return self.shards[key]
+
+    def shard(self, word: str) -> ReGra | None:
+        return self.load(shard_key(word))
+
+    def folded_index(self, word: str) -> 'FoldedIndex | None':
+        # A forma sem acentos de uma palavra tem a mesma shard_key que ela. O
+        # índice do shard é montado na primeira consulta, não ao carregá-lo
+        key = shard_key(word)
+        shard = self.load(key)
+        if shard is None:
+            return None
+
+        index = self.folded_indexes.get(key)
+        if index is None:
+            with self.locks[key]:
+                if key not in self.folded_indexes:
+                    self.folded_indexes[key] = FoldedIndex(shard.words())
+
+            index = self.folded_indexes[key]
+
+        return index
+
+    def all_shards(self) -> list[ReGra]:
+        return [self.load(key) for key in sorted(self.index)]
+
+    def loaded(self) -> list[ReGra]:
+        return list(self.shards.values())
+
+    def after_fork(self):
+        # A thread de prefetch não existe no processo filho; um shard que ela
+        # carregava ainda não foi publicado e será lido de novo se preciso
+        self.locks = {key: threading.Lock() for key in self.index}
+        self.prefetcher = None
+
+        for index in self.folded_indexes.values():
+            index.lock = threading.Lock()
+
+    def prefetch(self) -> threading.Thread:
+        if self.prefetcher is None:
+            self.prefetcher = threading.Thread(target=self.all_shards, daemon=True)
+            self.prefetcher.start()
+
+        return self.prefetcher
+
+    def __getitem__(self, word: str):
+        shard = self.shard(word) if word else None
+        return None if shard is None else shard[word]
+
+    def __len__(self) -> int:
+        return sum(shard['words'] for shard in self.index.values())
+
+    @property
+    def nodes(self) -> dict[str, Node]:
+        return {char: node for shard in self.all_shards() for char, node in shard.nodes.items()}
+
+    def get_parent(self, word: str) -> Node | None:
+        shard = self.shard(word)
+        return None if shard is None else shard.get_parent(word)
+
+    def root(self) -> Node:
+        return Node(head='', prox=self.nodes)
+
+    def node_children(self, node: Node):
+        return node.prox.items()
+
+    def node_data(self, node: Node) -> WordData | None:
+        return node.data
+
+    def root_view(self) -> Node:
+        return self.root()
+
+    def view_node(self, view: Node) -> Node:
+        return view
+
+    def build_summaries(self):
+        # Só os shards já carregados; os demais calculam ao serem consultados
+        for shard in self.loaded():
+            shard.build_summaries()
+
+    def subtree_tags(self, node: Node) -> int:
+        return self.shard(node.head).subtree_tags(node)
+
+    def iter_entries(self, current: Node, max_depth: float = 10, tag: str | None = None):
+        # Os nós pertencem ao shard da sua primeira letra; só a raiz vazia
+        # atravessa todos eles
+        if current.head:
+            return self.shard(current.head).iter_entries(current, max_depth, tag)
+
+        return chain.from_iterable(shard.iter_entries(shard.find(''), max_depth, tag)
+                                   for shard in self.all_shards())
+
+    def words(self):
+        return chain.from_iterable(shard.words() for shard in self.all_shards())
+
+    def search(self, word: str, max_distance: int = 2, transpositions: bool = False,
+               tag: str | None = None) -> list[tuple[str, int]]:
+        # Uma edição pode trocar a primeira letra, então todos os shards entram
+        results = [result for shard in self.all_shards()
+                   for result in shard.search(word, max_distance, transpositions, tag)]
+        results.sort(key=lambda x: x[1])
+
+        return results
+
+    def autocomplete(self, prefix: str, k: int = 10) -> list[str]:
+        if prefix:
+            shard = self.shard(prefix)
+            return [] if shard is None else shard.autocomplete(prefix, k)
+
+        return list(islice(heapq.merge(*[shard.autocomplete('', k) for shard in self.all_shards()],
+                                       key=completion_rank), k))
+
+
+def levenshtein_distance(word1: str, word2: str, max_distance: int | None = None,
+                         transpositions: bool = False) -> int:
+    '''
+    Distância de edição entre word1 e word2, calculada com duas linhas da matriz.
+
+    Com max_distance, apenas a faixa |i - j| <= max_distance é preenchida e a
+    função devolve max_distance + 1 assim que a distância passa do limite. Com
+    transpositions, a troca de dois caracteres vizinhos custa 1 (Damerau).
+    '''
+    len1 = len(word1)
+    len2 = len(word2)
+
+    if max_distance is None:
+        max_distance = max(len1, len2)
+
+    limit = max_distance + 1
+    if abs(len1 - len2) > max_distance:
+        return limit
+
+    before = None
+    previous = [j if j <= max_distance else limit for j in range(len2 + 1)]
+
+    for i in range(1, len1 + 1):
+        low = max(1, i - max_distance)
+        high = min(len2, i + max_distance)
+
+        current = [limit] * (len2 + 1)
+        current[0] = i if i <= max_distance else limit
+        char = word1[i - 1]
+
+        for j in range(low, high + 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1,
+                       previous[j - 1] + (char != word2[j - 1]))
+
+            if (transpositions and i > 1 and j > 1 and char == word2[j - 2]
+                    and word1[i - 2] == word2[j - 1]):
+                cost = min(cost, before[j - 2] + 1)
+
+            current[j] = min(cost, limit)
+
+        # Nenhuma linha seguinte pode ter valor menor que o mínimo desta
+        if min(current[low - 1:high + 1]) >= limit:
+            return limit
+
+        before, previous = previous, current
+
+    return previous[len2]
+
+
+def batch_levenshtein(word: str, candidates: list[str], transpositions: bool = False) -> list[int]:
+    '''
+    Distância de word para cada candidato, igual à de levenshtein_distance.
+
+    Os candidatos são codificados numa matriz de inteiros e cada linha da
+    programação dinâmica é calculada de uma vez para todos eles. As inserções,
+    que dependem da célula à esquerda, são resolvidas com um mínimo acumulado.
+    '''
+    count = len(candidates)
+    if count == 0:
+        return []
+
+    lengths = np.fromiter(map(len, candidates), dtype=np.intp, count=count)
+    width = int(lengths.max())
+    if width == 0:
+        return [len(word)] * count
+
+    # O preenchimento após o fim de cada candidato nunca é lido no resultado
+    codes = np.frombuffer(''.join(c.ljust(width, '\0') for c in candidates).encode('utf-32-le'),
+                          dtype=np.uint32).reshape(count, width)
+
+    steps = np.arange(width + 1)
+    previous = np.tile(steps, (count, 1))
+    before = None
+
+    for i, char in enumerate(word, 1):
+        current = np.empty_like(previous)
+        current[:, 0] = i
+        current[:, 1:] = np.minimum(previous[:, 1:] + 1,
+                                    previous[:, :-1] + (codes != ord(char)))
+
+        if transpositions and i > 1:
+            swap = (codes[:, :-1] == ord(char)) & (codes[:, 1:] == ord(word[i - 2]))
+            current[:, 2:] = np.where(swap, np.minimum(current[:, 2:], before[:, :-2] + 1),
+                                      current[:, 2:])
+
+        # current[j] = min(current[k] + j - k) para todo k <= j
+        current = np.minimum.accumulate(current - steps, axis=1) + steps
+        before, previous = previous, current
+
+    return previous[np.arange(count), lengths].tolist()
+
+
+# A partir de quantos candidatos a ordenação usa batch_levenshtein
+BATCH_MIN_CANDIDATES = 8
+
+
+def nearest(word: str, candidates, n: int = 10, transpositions: bool = False) -> list[str]:
+    if np is not None and len(candidates) > BATCH_MIN_CANDIDATES:
+        candidates = list(candidates)
+        distances = batch_levenshtein(word, candidates, transpositions)
+
+        return [candidates[i] for i in heapq.nsmallest(n, range(len(candidates)),
+                                                       key=distances.__getitem__)]
+
+    # Mesmo resultado de ordenar todos os candidatos pela distância e pegar os
+    # n primeiros, mas cada distância só é calculada até a pior das n melhores
+    best = []
+
+    for i, candidate in enumerate(candidates):
+        if len(best) < n:
+            distance = levenshtein_distance(word, candidate, transpositions=transpositions)
+            heapq.heappush(best, (-distance, -i, candidate))
+            continue
+
+        worst = -best[0][0]
+        distance = levenshtein_distance(word, candidate, worst - 1, transpositions)
+
+        if distance < worst:
+            heapq.heapreplace(best, (-distance, -i, candidate))
+
+    return [x[2] for x in sorted(best, key=lambda x: (-x[0], -x[1]))]
+
+
+def bounded_search(word: str, max_distance: int, roots, children, data, subtree=None,
+                   transpositions: bool = False) -> list[tuple[str, int]]:
+    '''
+    Busca na árvore todas as palavras a até max_distance edições de word.
+
+    Cada aresta visitada recebe uma linha da matriz de Levenshtein calculada a
+    partir da linha do pai; se o menor valor da linha passa de max_distance,
+    nenhuma palavra abaixo pode estar dentro do limite e o ramo é descartado.
+
+    roots e children(node) devolvem pares (rótulo da aresta, nó) e data(node)
+    devolve os dados da palavra que termina no nó, ou None. Se subtree(node)
+    for falso, o nó e tudo abaixo dele são ignorados.
+    '''
+    results = []
+    size = len(word)
+
+    stack = [(label, node, '', list(range(size + 1)), None, '') for label, node in roots]
+    while stack:
+        label, node, prefix, row, before, last = stack.pop()
+        if subtree is not None and not subtree(node):
+            continue
+
+        for char in label:
+            new_row = [row[0] + 1]
+            for j in range(1, size + 1):
+                cost = min(new_row[j - 1] + 1, row[j] + 1,
+                           row[j - 1] + (word[j - 1] != char))
+
+                if (transpositions and before is not None and j > 1
+                        and char == word[j - 2] and last == word[j - 1]):
+                    cost = min(cost, before[j - 2] + 1)
+
+                new_row.append(cost)
+
+            before, row, last = row, new_row, char
+
+            if min(row) > max_distance:
+                break
+
+        else:
+            head = prefix + label
+            if row[size] <= max_distance and data(node) is not None:
+                results.append((head, row[size]))
+
+            for child in children(node):
+                stack.append((*child, head, row, before, last))
+
+    results.sort(key=lambda x: x[1])
+
+    return results
+
+
+def node_tags(data: WordData | None) -> int:
+    return 0 if data is None else tags_mask(data['tag'])
+
+
+def tag_summaries(roots, children, tags) -> dict:
+    # União das etiquetas de cada nó com as de todos os seus descendentes,
+    # calculada em pós-ordem sem recursão
+    summaries = {}
+    stack = [(node, False) for node in roots]
+    while stack:
+        node, visited = stack.pop()
+        if visited:
+            mask = tags(node)
+            for child in children(node):
+                mask |= summaries[child]
+            summaries[node] = mask
+
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for child in children(node))
+
+    return summaries
+
+
+def completion_rank(word: str):
+    # Sem frequências no léxico, as palavras mais curtas vêm primeiro
+    return (len(word), word)
+
+
+def top_completions(roots, children, final, k: int = 10, key=None) -> dict:
+    '''
+    As k melhores palavras (pela ordem de key) de cada subárvore, calculadas
+    em pós-ordem sem recursão. Cada nó junta a própria palavra às listas já
+    ordenadas dos filhos, então o custo é proporcional a k por nó.
+
+    roots e children(node) devolvem pares (rótulo da aresta, nó) e final(node)
+    diz se uma palavra termina no nó. A lista de toda a árvore fica em None.
+    '''
+    key = completion_rank if key is None else key
+    roots = list(roots)
+    best = {}
+
+    stack = [(label, node, '', False) for label, node in roots]
+    while stack:
+        label, node, prefix, visited = stack.pop()
+        head = prefix + label
+
+        if visited:
+            lists = [best[child] for _, child in children(node)]
+            if final(node):
+                lists.append((head,))
+
+            # Um caminho sem bifurcação reaproveita a tupla do filho
+            if len(lists) == 1:
+                best[node] = lists[0]
+            else:
+                best[node] = tuple(islice(heapq.merge(*lists, key=key), k))
+
+        else:
+            stack.append((label, node, prefix, True))
+            stack.extend((*child, head, False) for child in children(node))
+
+    best[None] = tuple(islice(heapq.merge(*[best[node] for _, node in roots], key=key), k))
+
+    return best
+
+
+def tag_filter(tag: str | None, data, subtree_tags, tag_bit=None):
+    # Funções data/subtree para bounded_search restritas às palavras com a etiqueta.
+    # tag_bit dá o bit da etiqueta nas máscaras de subtree_tags, se não for TAG_BITS
+    if tag is None:
+        return data, None
+
+    bit = tags_mask((tag,)) if tag_bit is None else tag_bit(tag)
+
+    def tagged(node):
+        value = data(node)
+        return value if value is not None and tag in value['tag'] else None
+
+    return tagged, lambda node: subtree_tags(node) & bit
+
+
+def deletions(word: str, max_distance: int) -> set[str]:
+    # Todas as variantes de word com até max_distance letras removidas
+    variants = {word}
+    level = {word}
+
+    for _ in range(max_distance):
+        level = {x[:i] + x[i + 1:] for x in level for i in range(len(x))}
+        variants |= level
+
+    return variants
+
+
+class DeleteIndex():
+    '''
+    Índice de remoções simétricas (SymSpell).
+
+    Cada palavra do dicionário é registrada sob todas as formas obtidas
+    removendo até max_distance letras dos seus primeiros prefix_length
+    caracteres. Uma consulta gera as remoções da palavra buscada e junta as
+    palavras registradas sob elas, confirmando cada uma com
+    levenshtein_distance; são poucas consultas a uma tabela hash em vez de
+    percorrer a árvore.
+    '''
+
+    def __init__(self, words=(), max_distance: int = 2, prefix_length: int = 7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.words: list[str] = []
+
+        # Uma variante aponta para o índice de uma palavra ou para uma lista deles
+        self.deletes: dict[str, int | list[int]] = {}
+
+        start = time.perf_counter()
+        for word in words:
+            self.add(word)
+        self.build_seconds = time.perf_counter() - start
+
+    def add(self, word: str):
+        idx = len(self.words)
+        self.words.append(word)
+
+        for variant in deletions(word[:self.prefix_length], self.max_distance):
+            current = self.deletes.get(variant)
+
+            if current is None:
+                self.deletes[variant] = idx
+            elif isinstance(current, int):
+                self.deletes[variant] = [current, idx]
+            else:
+                current.append(idx)
+
+    def lookup(self, word: str, max_distance: int | None = None,
+               transpositions: bool = False) -> list[tuple[str, int]]:
+        if max_distance is None:
+            max_distance = self.max_distance
+
+        if max_distance > self.max_distance:
+            raise ValueError(f'Index was built for max_distance={self.max_distance}')
+
+        results = {}
+        for variant in deletions(word[:self.prefix_length], max_distance):
+            found = self.deletes.get(variant)
+            if found is None:
+                continue
+
+            for idx in [found] if isinstance(found, int) else found:
+                candidate = self.words[idx]
+                if candidate in results:
+                    continue
+
+                results[candidate] = levenshtein_distance(
+                    word, candidate, max_distance, transpositions)
+
+        return sorted([x for x in results.items() if x[1] <= max_distance], key=lambda x: x[1])
+
+    def save(self, path: str):
+        with open(path, 'wb') as out:
+            pickle.dump((self.max_distance, self.prefix_length, self.words, self.deletes),
+                        out, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> 'DeleteIndex':
+        index = cls()
+        with open(path, 'rb') as f:
+            index.max_distance, index.prefix_length, index.words, index.deletes = pickle.load(f)
+
+        return index
+
+
+class BKTree():
+    '''
+    Árvore BK sobre as palavras do dicionário.
+
+    Cada filho fica sob a distância até o pai. Numa consulta com raio k, se a
+    palavra buscada está a d do nó, pela desigualdade triangular só os filhos
+    sob distâncias entre d - k e d + k podem conter respostas.
+    '''
+
+    def __init__(self, words=()):
+        # Cada nó é uma lista [palavra, {distância: filho}]
+        self.root: list | None = None
+        self.size = 0
+        self.visited = 0
+
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str):
+        self.size += 1
+
+        if self.root is None:
+            self.root = [word, {}]
+            return
+
+        node = self.root
+        while True:
+            distance = levenshtein_distance(word, node[0])
+            if distance == 0:
+                self.size -= 1
+                return
+
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [word, {}]
+                return
+
+            node = child
+
+    def query(self, word: str, max_distance: int = 2) -> list[tuple[str, int]]:
+        results = []
+        self.visited = 0
+
+        stack = [] if self.root is None else [self.root]
+        while stack:
+            candidate, children = stack.pop()
+            self.visited += 1
+
+            # Acima desse limite nenhum filho é visitado, então a distância
+            # exata não é necessária
+            limit = max_distance + max(children, default=0)
+            distance = levenshtein_distance(word, candidate, limit)
+            if distance <= max_distance:
+                results.append((candidate, distance))
+
+            for key, child in children.items():
+                if distance - max_distance <= key <= distance + max_distance:
+                    stack.append(child)
+
+        results.sort(key=lambda x: x[1])
+
+        return results
+
+
+def fold(word: str) -> str:
+    # Forma sem acentos, cedilha ou maiúsculas: 'Não' e 'nao' viram 'nao'
+    decomposed = unicodedata.normalize('NFD', word.lower())
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+class FoldedIndex():
+    '''
+    Tabela das palavras do dicionário pela forma sem acentos (fold).
+
+    Erros de acentuação ('voce', 'nao', 'esta') são resolvidos com uma única
+    consulta à tabela, sem busca por distância de edição. hits e misses contam
+    as consultas que encontraram ou não alguma palavra.
+    '''
+
+    def __init__(self, words=()):
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        # Uma forma aponta para uma palavra ou, se houver várias, para uma lista
+        self.forms: dict[str, str | list[str]] = {}
+
+        start = time.perf_counter()
+        for word in words:
+            self.add(word)
+        self.build_seconds = time.perf_counter() - start
+
+    def add(self, word: str):
+        key = fold(word)
+        current = self.forms.get(key)
+
+        if current is None:
+            self.forms[key] = word
+        elif isinstance(current, str):
+            if current != word:
+                self.forms[key] = [current, word]
+        elif word not in current:
+            current.append(word)
+
+    def lookup(self, word: str) -> list[str]:
+        return self.__count__(self.forms.get(fold(word)))
+
+    def __count__(self, found: str | list[str] | None) -> list[str]:
+        with self.lock:
+            if found is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if found is None:
+            return []
+
+        return [found] if isinstance(found, str) else list(found)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+
+        return {
+            'size': len(self.forms),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
+
+
+class ShardedFoldedIndex(FoldedIndex):
+    # Consulta os índices que a ShardedReGra monta com cada shard; aqui ficam
+    # só as contagens de acertos de quem usa o índice
+    def __init__(self, dictionary: ShardedReGra):
+        super().__init__()
+        self.dictionary = dictionary
+
+    def lookup(self, word: str) -> list[str]:
+        index = self.dictionary.folded_index(word)
+        return self.__count__(None if index is None else index.forms.get(fold(word)))
+
+    def stats(self) -> dict:
+        stats = super().stats()
+        stats['size'] = sum(len(index.forms) for index in list(self.dictionary.folded_indexes.values()))
+
+        return stats
+
+
+def clean_text(text: str):
+    return text.lower().replace(',', '').replace('.', '').replace(
+        '!', '').replace('?', '').replace(';', '')
+
+
+def split_text(text: str, limit: int = LXPARSER_MAX_CHARS) -> list[str]:
+    # Divide o texto em pedaços de até limit caracteres, cortando entre frases.
+    # Frases maiores que o limite são cortadas entre palavras.
+    pieces = []
+    for sentence in re.split(r'(?<=[.!?…])\s+', text.strip()):
+        while len(sentence) > limit:
+            cut = sentence.rfind(' ', 0, limit + 1)
+            cut = limit if cut <= 0 else cut
+            pieces.append(sentence[:cut])
+            sentence = sentence[cut:].lstrip()
+
+        if sentence:
+            pieces.append(sentence)
+
+    chunks = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) + 1 + len(piece) <= limit:
+            chunks[-1] += ' ' + piece
+        else:
+            chunks.append(piece)
+
+    return chunks
+
+
+def join_trees(trees: list[Tree]) -> Tree:
+    # Junta as árvores das frases sob uma única raiz, na ordem do texto
+    if len(trees) == 1:
+        return trees[0]
+
+    children = []
+    for tree in trees:
+        children += list(tree) if tree.label() == 'ROOT' else [tree]
+
+    return Tree('ROOT', children)
+
+
+def read_conllu(path: str):
+    # Frases de um arquivo CoNLL-U como listas de (palavra, etiqueta UD)
+    sentence = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
 
-    def __getitem__(self, word: str):
-        if word[0] not in self.nodes.keys():
-            return None
+            if not line:
+                if sentence:
+                    yield sentence
+                sentence = []
 
-        node = self.dive(self.nodes[word[0]], word, 1)
+            elif not line.startswith('#'):
+                columns = line.split('\t')
+                if columns[0].isdigit():
+                    sentence.append((columns[1].lower(), columns[3]))
 
-        if node.head != word:
-            return None
+    if sentence:
+        yield sentence
 
-        return node.data
 
-    def __setitem__(self, idx: str, value: WordData):
-        parent = self.get_parent(idx)
+class LexiconTagger():
+    '''
+    Etiquetador morfossintático local, construído só com o dicionário.
 
-        # Se o conjunto está vazio ou uma letra base não existe
-        if parent is None:
-            if len(idx) == 1:
-                self.nodes[idx] = Node(head=idx, data=value)
-                return
+    A chance de cada etiqueta para uma palavra conhecida vem das etiquetas
+    dela no dicionário, pesadas pela frequência de cada etiqueta no léxico;
+    para palavras desconhecidas, das etiquetas das palavras com o mesmo final.
+    As transições entre etiquetas podem ser aprendidas com train e a melhor
+    sequência é escolhida com Viterbi.
 
-            parent = Node(head=idx[0])
-            self.nodes[idx[0]] = parent
+    tag devolve o mesmo (lx_parsed, tree) que Corretor.__lxparse__.
+    '''
 
-            for i in range(1, len(idx) - 1):
-                parent.prox[idx[i]] = Node(head=idx[:i + 1])
-                parent = parent.prox[idx[i]]
+    def __init__(self, dictionary, suffix_length: int = 3):
+        self.dictionary = dictionary
+        self.suffix_length = suffix_length
+        self.transitions: dict[str, Counter] = {}
 
-            parent.prox[idx[-1]] = Node(head=idx, data=value)
-            return
+        self.priors = Counter()
+        self.suffixes: dict[str, Counter] = {}
 
-        # Se a palavra existe, atualiza os dados
-        if parent.head == idx:
-            if parent.data is None:
-                parent.data = value
+        for word in dictionary.words():
+            tags = dictionary[word]['tag']
+            self.priors.update(tags)
 
-            else:
-                parent.data['raiz'] = parent.data['raiz'].union(value['raiz'])
-                parent.data['tag'] = parent.data['tag'].union(
-                    value['tag'])
-                parent.data['features'] = parent.data['features'].union(
-                    value['features'])
+            for size in range(1, min(suffix_length, len(word)) + 1):
+                self.suffixes.setdefault(word[-size:], Counter()).update(tags)
 
-            return
+        self.tags = sorted(self.priors)
 
-        # Se a palavra não existe, mas é filha de uma que existe
-        # cria o nó dela
-        if len(parent.head) + 1 == len(idx):
-            parent.prox[idx[-1]] = Node(head=idx, data=value)
+    def train(self, sentences):
+        # Conta as transições entre etiquetas de frases já etiquetadas
+        for sentence in sentences:
+            previous = '<s>'
+            for _, tag in sentence:
+                self.transitions.setdefault(previous, Counter())[tag] += 1
+                previous = tag
+
+    def emissions(self, word: str) -> dict[str, float]:
+        entry = self.dictionary[word]
+
+        if entry is not None:
+            counts = {tag: self.priors[tag] for tag in entry['tag'] if tag in self.priors}
 
-        # Se a palavra não existe, e não é filha de uma que existe
-        # cria um caminho de nós até ela
         else:
-            for i in range(len(parent.head), len(idx) - 1):
-                parent.prox[idx[i]] = Node(head=idx[:i + 1])
-                parent = parent.prox[idx[i]]
+            counts = self.priors
+            for size in range(min(self.suffix_length, len(word)), 0, -1):
+                if word[-size:] in self.suffixes:
+                    counts = self.suffixes[word[-size:]]
+                    break
 
-            parent.prox[idx[-1]] = Node(head=idx, data=value)
+        total = sum(counts.values())
 
-    def __repr__(self) -> str:
-        string = ''
-        for node in self.nodes.values():
-            string += self.build_tree(node)
+        return {tag: math.log(count / total) for tag, count in counts.items() if count}
 
-        return string
+    def transition(self, previous: str, tag: str) -> float:
+        counts = self.transitions.get(previous, Counter())
+        return math.log((counts[tag] + 1) / (sum(counts.values()) + len(self.tags)))
 
-    def build_tree(self, current: Node, depth: int = 0):
-        string = f"{'-' * depth} {current.head}{' OK' if current.data is not None else ''}\n"
+    def best_tags(self, words: list[str]) -> list[str]:
+        if not words:
+            return []
 
-        for node in current.prox.values():
-            string += self.build_tree(node, depth + 1)
+        # Viterbi: melhor pontuação de cada etiqueta e de onde ela veio
+        scores = {tag: self.transition('<s>', tag) + score
+                  for tag, score in self.emissions(words[0]).items()}
+        back = []
 
-        return string
+        for word in words[1:]:
+            new_scores, pointers = {}, {}
+            for tag, score in self.emissions(word).items():
+                previous = max(scores, key=lambda p: scores[p] + self.transition(p, tag))
+                new_scores[tag] = scores[previous] + self.transition(previous, tag) + score
+                pointers[tag] = previous
 
-    def get_children(self, current: Node, max_depth: int = 10, depth: int = 0) -> list[str]:
-        if depth >= max_depth:
-            return []
+            scores = new_scores
+            back.append(pointers)
 
-        children = []
+        tag = max(scores, key=scores.get)
+        tags = [tag]
+        for pointers in reversed(back):
+            tag = pointers[tag]
+            tags.append(tag)
 
-        for node in current.prox.values():
-            if node.data is not None:
-                children.append(node.head)
+        return tags[::-1]
 
-            children += self.get_children(node,
-                                          max_depth=max_depth, depth=depth + 1)
+    def tag(self, text: str, symbols: dict = lxparse_symbols):
+        words = re.findall(r'\w+', text)
+        tags = self.best_tags([w.lower() for w in words])
 
-        return children
+        # Só as classes que o LX-Parser também devolveria
+        classes = {tag for values in symbols.values() for tag in values}
+        lx_parsed = [[word, [tag]] for word, tag in zip(words, tags)
+                     if tag in classes and word.isalpha()]
 
+        tree = Tree('ROOT', [Tree(tag, [word]) for word, tag in zip(words, tags)])
+
+        return lx_parsed, tree
 
-def levenshtein_distance(word1, word2):
-    len1 = len(word1)
-    len2 = len(word2)
 
-    matrix_len = max(len1, len2) + 1
-    matrix = [[0 for _ in range(matrix_len)] for _ in range(matrix_len)]
+class LRUCache():
+    # Cache de tamanho limitado que descarta o item usado há mais tempo
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
 
-    for i in range(matrix_len):
-        matrix[i][0] = i
-        matrix[0][i] = i
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.items:
+                self.misses += 1
+                return default
 
-    for i in range(1, matrix_len):
-        for j in range(1, matrix_len):
-            matrix[i][j] = min(matrix[i - 1][j], matrix[i]
-                               [j - 1], matrix[i - 1][j - 1])
+            self.hits += 1
+            self.items.move_to_end(key)
 
-            if i > len1:
-                matrix[i][j] += 1
-            elif j > len2:
-                matrix[i][j] += 1
-            elif word1[i - 1] != word2[j - 1]:
-                matrix[i][j] += 1
+            return self.items[key]
 
-    return matrix[matrix_len - 1][matrix_len - 1]
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
 
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+
+            if len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            'size': len(self.items),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
 
-def clean_text(text: str):
-    return text.lower().replace(',', '').replace('.', '').replace(
-        '!', '').replace('?', '').replace(';', '')
+
+class ParseCache():
+    '''
+    Cache persistente (SQLite) das respostas do LX-Parser.
+
+    Guarda a árvore entre parênteses devolvida pelo serviço, indexada pelo hash
+    do texto normalizado e da tabela de símbolos. Entradas mais velhas que ttl
+    segundos são descartadas e, se o total passar de max_bytes, as usadas há
+    mais tempo são removidas.
+    '''
+
+    def __init__(self, path: str, ttl: float | None = None, max_bytes: int | None = None):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+
+        # Com WAL e synchronous=NORMAL um commit não espera o disco; cada acerto
+        # atualiza o horário de acesso sem pagar uma escrita síncrona
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS parses ('
+            'key TEXT PRIMARY KEY, result TEXT, size INTEGER, created REAL, accessed REAL)')
+        self.connection.execute(
+            'CREATE INDEX IF NOT EXISTS parses_accessed ON parses (accessed)')
+        self.connection.commit()
+
+        # Total guardado, mantido em memória para que put não some a tabela
+        self.stored = self.connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM parses').fetchone()[0]
+
+    def key(self, text: str, symbols: dict) -> str:
+        normalized = ' '.join(text.split())
+        table = json.dumps(symbols, sort_keys=True, ensure_ascii=False)
+
+        return hashlib.sha256(f'{normalized}\0{table}'.encode('utf-8')).hexdigest()
+
+    def get(self, text: str, symbols: dict) -> str | None:
+        key = self.key(text, symbols)
+        now = time.time()
+
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT result, created, size FROM parses WHERE key = ?', (key,)).fetchone()
+
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self.connection.execute('DELETE FROM parses WHERE key = ?', (key,))
+                self.connection.commit()
+                self.stored -= row[2]
+                self.evictions += 1
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.connection.execute('UPDATE parses SET accessed = ? WHERE key = ?', (now, key))
+            self.connection.commit()
+            self.hits += 1
+
+            return row[0]
+
+    def put(self, text: str, symbols: dict, result: str):
+        key = self.key(text, symbols)
+        now = time.time()
+
+        size = len(result.encode('utf-8'))
+
+        with self.lock:
+            old = self.connection.execute('SELECT size FROM parses WHERE key = ?', (key,)).fetchone()
+            self.connection.execute(
+                'INSERT OR REPLACE INTO parses VALUES (?, ?, ?, ?, ?)', (key, result, size, now, now))
+            self.stored += size - (old[0] if old is not None else 0)
+
+            if self.max_bytes is not None and self.stored > self.max_bytes:
+                # O cursor é lido só até liberar espaço suficiente
+                evicted = []
+                for old_key, old_size in self.connection.execute(
+                        'SELECT key, size FROM parses ORDER BY accessed'):
+                    if self.stored <= self.max_bytes:
+                        break
+
+                    evicted.append((old_key,))
+                    self.stored -= old_size
+
+                self.connection.executemany('DELETE FROM parses WHERE key = ?', evicted)
+                self.evictions += len(evicted)
+
+            self.connection.commit()
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute('DELETE FROM parses')
+            self.connection.commit()
+            self.stored = 0
+
+    def close(self):
+        self.connection.close()
+
+    def stats(self) -> dict:
+        with self.lock:
+            entries, stored = self.connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM parses').fetchone()
+
+        requests = self.hits + self.misses
+
+        return {
+            'entries': entries,
+            'bytes': stored,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / requests if requests else 0.0,
+        }
 
 
 class WSException(Exception):
@@ -187,62 +2202,533 @@ class WSException(Exception):
         return self.message
 
 
+class ServiceUnavailable(Exception):
+    'The webservice kept answering with a status in RETRY_STATUS until the retries ran out'
+
+    def __init__(self, status: int, url: str):
+        super().__init__(f'{status} from {url}')
+        self.status = status
+
+
+# Falhas de comunicação com o LX-Parser em que o etiquetador local assume:
+# serviço inalcançável, tempo esgotado ou indisponível após as repetições.
+# Erros de chave, de URL ou de resposta inválida continuam sendo levantados
+TAGGER_FAILURES = (requests.ConnectionError, requests.Timeout, asyncio.TimeoutError, ServiceUnavailable) + (
+    () if aiohttp is None else (aiohttp.ClientConnectionError,))
+
+
+class LXParserClient():
+    '''
+    Cliente JSON-RPC do LX-Parser.
+
+    Mantém uma sessão com conexões reaproveitadas (keep-alive), aplica limites
+    de tempo de conexão e de leitura e repete falhas passageiras (erro de rede,
+    tempo esgotado ou status em RETRY_STATUS) com espera exponencial aleatória.
+    Um status em RETRY_STATUS que persiste vira ServiceUnavailable. Erros
+    devolvidos pelo serviço viram WSException e não são repetidos.
+    '''
+
+    def __init__(self, key: str = '', url: str = LXPARSER_WS_API_URL,
+                 connect_timeout: float = 5.0, read_timeout: float = 60.0,
+                 retries: int = 3, backoff: float = 0.5, pool_size: int = 10):
+        self.key = key
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+
+        self.pool_size = pool_size
+        self.session = self.__open_session__()
+
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=1000)
+        self.calls = 0
+        self.retried = 0
+        self.failures = 0
+
+    def settings(self) -> dict:
+        # Argumentos para criar outro cliente com a mesma configuração
+        return {
+            'key': self.key,
+            'url': self.url,
+            'connect_timeout': self.timeout[0],
+            'read_timeout': self.timeout[1],
+            'retries': self.retries,
+            'backoff': self.backoff,
+            'pool_size': self.pool_size,
+        }
+
+    def __open_session__(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+
+        return session
+
+    def after_fork(self):
+        # O processo filho herda a sessão do pai com as conexões abertas; só
+        # ela e a trava são refeitas, mantendo o cliente e a sua configuração
+        self.lock = threading.Lock()
+        self.session = self.__open_session__()
+
+    def request_data(self, text: str, format: str) -> dict:
+        return {
+            'method': 'parse',
+            'jsonrpc': '2.0',
+            'id': 0,
+            'params': {
+                'text': text,
+                'format': format,
+                'key': self.key,
+            },
+        }
+
+    def parse(self, text: str, format: str = 'parentheses'):
+        '''
+        Arguments
+            text: a string with a maximum of 2000 characters, Portuguese text, with
+                the input to be processed
+            format: either 'parentheses', 'table' or 'JSON'
+
+        Returns a string or JSON object with the output according to specification in
+        https://portulanclarin.net/workbench/lx-parser/
+
+        Raises a WSException if an error occurs.
+        '''
+
+        request_data = self.request_data(text, format)
+
+        with self.lock:
+            self.calls += 1
+
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                with self.lock:
+                    self.retried += 1
+
+                time.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+
+            start = time.perf_counter()
+            try:
+                response = self.session.post(self.url, json=request_data, timeout=self.timeout)
+
+            except (requests.ConnectionError, requests.Timeout) as error:
+                failure = error
+                continue
+
+            if response.status_code in RETRY_STATUS:
+                failure = ServiceUnavailable(response.status_code, self.url)
+                continue
+
+            response.raise_for_status()
+            response_data = response.json()
+
+            with self.lock:
+                self.latencies.append(time.perf_counter() - start)
+
+            if "error" in response_data:
+                raise WSException(response_data["error"])
+
+            return response_data["result"]
+
+        with self.lock:
+            self.failures += 1
+
+        raise failure
+
+    def stats(self) -> dict:
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = {'calls': self.calls, 'retries': self.retried, 'failures': self.failures}
+
+        if latencies:
+            stats.update({
+                'mean_ms': sum(latencies) / len(latencies) * 1e3,
+                'p50_ms': latencies[len(latencies) // 2] * 1e3,
+                'p95_ms': latencies[int(len(latencies) * 0.95)] * 1e3,
+                'max_ms': latencies[-1] * 1e3,
+            })
+
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncLXParserClient(LXParserClient):
+    '''
+    Versão assíncrona do LXParserClient, sobre aiohttp, com os mesmos limites
+    de tempo, repetições e estatísticas. A sessão é aberta no laço de eventos
+    em que o cliente é usado e refeita se ele mudar.
+    '''
+
+    def __open_session__(self):
+        self.loop = None
+        return None
+
+    def after_fork(self):
+        # A sessão herdada pertence ao laço e às conexões do pai: é solta sem
+        # fechar o conector, que fica guardado para que o coletor do filho
+        # também não tente fechá-lo
+        if self.session is not None:
+            self.inherited = self.session.connector
+            self.session.detach()
+
+        super().after_fork()
+
+    async def parse(self, text: str, format: str = 'parentheses'):
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.loop is not loop:
+            # A nova sessão é publicada antes de qualquer await, para que as
+            # chamadas concorrentes no mesmo laço não criem outras; só então a
+            # sessão do laço anterior é fechada
+            old, self.session = self.session, aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.timeout[0], sock_read=self.timeout[1]))
+            self.loop = loop
+
+            if old is not None:
+                await old.close()
+
+        request_data = self.request_data(text, format)
+
+        with self.lock:
+            self.calls += 1
+
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                with self.lock:
+                    self.retried += 1
+
+                await asyncio.sleep(random.uniform(0, self.backoff * 2 ** (attempt - 1)))
+
+            start = time.perf_counter()
+            try:
+                async with self.session.post(self.url, json=request_data) as response:
+                    if response.status in RETRY_STATUS:
+                        failure = ServiceUnavailable(response.status, self.url)
+                        continue
+
+                    response.raise_for_status()
+                    response_data = await response.json(content_type=None)
+
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as error:
+                failure = error
+                continue
+
+            with self.lock:
+                self.latencies.append(time.perf_counter() - start)
+
+            if "error" in response_data:
+                raise WSException(response_data["error"])
+
+            return response_data["result"]
+
+        with self.lock:
+            self.failures += 1
+
+        raise failure
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
 class Corretor():
-    def __init__(self, dictionary_path: str = '', dictionary: ReGra = None, key: str = '', symbols: dict = {}):
+    def __init__(self, dictionary_path: str = '', dictionary: ReGra = None, key: str = '', symbols: dict = {},
+                 search: str = 'prefix', max_distance: int = 2, transpositions: bool = False,
+                 cache_size: int = 4096, parse_cache: ParseCache | None = None, max_workers: int = 4,
+                 tagger='remote'):
         self.dictionary = dictionary
-        
+        self.local_tagger: LexiconTagger | None = None
+        self.parse_cache = parse_cache
+        self.max_workers = max_workers
+        self.executor: ThreadPoolExecutor | None = None
+        self.async_parser: AsyncLXParserClient | None = None
+        self.lock = threading.Lock()
+        self.corrections_cache = LRUCache(cache_size)
+        self.delete_index: DeleteIndex | None = None
+        self.bk_tree: BKTree | None = None
+        self.folded_index: FoldedIndex | None = None
+        self.fold_accents = True
+
         if dictionary is None and len(dictionary_path) > 0:
             self.dictionary = self.__load_dicionary__(dictionary_path)
             
         elif dictionary is not None:
             print('Using provided dictionary, ignoring provided dictionary path')
             
-            
         self.LXPARSER_WS_API_KEY = key
+        self.parser = LXParserClient(key, pool_size=max(10, max_workers))
         self.symbol_convertion = symbols
+        self.setup_search(search, max_distance, transpositions)
+        self.setup_tagger(tagger)
 
     def setup_key(self, key: str):
         self.LXPARSER_WS_API_KEY = key
+        self.parser.key = key
+
+        if self.async_parser is not None:
+            self.async_parser.key = key
+
+    def setup_parser(self, parser: LXParserClient):
+        self.parser = parser
+        self.async_parser = None
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+        self.parser.close()
+
+    async def close_async(self):
+        if self.async_parser is not None:
+            await self.async_parser.close()
+
+        self.close()
+
+    def __after_fork__(self):
+        # Recursos que um processo filho não pode compartilhar com o pai:
+        # threads, travas, conexões HTTP e a conexão com o SQLite. Uma trava
+        # presa por uma thread do pai no fork nunca seria liberada no filho
+        global BITS_LOCK
+        BITS_LOCK = threading.Lock()
+
+        self.lock = threading.Lock()
+        self.corrections_cache.lock = threading.Lock()
+        if self.folded_index is not None:
+            self.folded_index.lock = threading.Lock()
+
+        if isinstance(self.dictionary, ShardedReGra):
+            self.dictionary.after_fork()
+
+        self.executor = None
+        if self.async_parser is not None:
+            self.async_parser.after_fork()
+
+        if isinstance(self.parser, LXParserClient):
+            self.parser.after_fork()
+
+        if self.parse_cache is not None:
+            self.parse_cache = ParseCache(
+                self.parse_cache.path, self.parse_cache.ttl, self.parse_cache.max_bytes)
+
+    def __executor__(self) -> ThreadPoolExecutor:
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+            return self.executor
 
     def setup_symbols(self, symbols: dict):
         self.symbol_convertion = symbols
+
+    def setup_parse_cache(self, parse_cache: ParseCache | None):
+        self.parse_cache = parse_cache
+
+    def setup_tagger(self, tagger):
+        # 'remote': LX-Parser
+        # 'local': LexiconTagger, construído com o dicionário no primeiro uso
+        # 'fallback': LX-Parser, trocando pelo local se o serviço não responder
+        # ou qualquer objeto com tag(text) -> (lx_parsed, tree)
+        if isinstance(tagger, str) and tagger not in ('remote', 'local', 'fallback'):
+            raise ValueError(f'Unknown tagger: {tagger}')
+
+        self.tagger = tagger
         
     def setup_dictionary(self, dictionary: ReGra):
         self.dictionary = dictionary
+        self.delete_index = None
+        self.bk_tree = None
+        self.folded_index = None
+        self.fold_accents = True
+        self.local_tagger = None
+        self.corrections_cache.clear()
+
+    def setup_delete_index(self, index: DeleteIndex):
+        self.delete_index = index
+        self.corrections_cache.clear()
+
+    def setup_folded_index(self, index: FoldedIndex | None):
+        # None desliga o primeiro nível de correções (só acentos)
+        self.folded_index = index
+        self.fold_accents = index is not None
+        self.corrections_cache.clear()
+
+    def setup_search(self, search: str, max_distance: int = 2, transpositions: bool = False):
+        # 'prefix': filhos de um prefixo da palavra, ordenados pela distância
+        # 'levenshtein': busca limitada a max_distance edições em toda a árvore
+        # 'deletions': consulta ao DeleteIndex, construído no primeiro uso
+        # 'bktree': consulta à BKTree, construída no primeiro uso
+        # transpositions: a troca de duas letras vizinhas conta como uma edição
+        # (não se aplica à BKTree, que depende da desigualdade triangular)
+        if search not in ('prefix', 'levenshtein', 'deletions', 'bktree'):
+            raise ValueError(f'Unknown search mode: {search}')
+
+        self.search = search
+        self.max_distance = max_distance
+        self.transpositions = transpositions
+        self.corrections_cache.clear()
+
+    def __folded_index__(self) -> FoldedIndex | None:
+        # Construído na primeira correção, como o DeleteIndex e a BKTree, para
+        # que abrir o corretor não percorra o léxico inteiro
+        if not self.fold_accents or self.dictionary is None:
+            return None
+
+        with self.lock:
+            if self.folded_index is None:
+                # Com shards, cada um monta o seu índice na primeira consulta a ele
+                if isinstance(self.dictionary, ShardedReGra):
+                    self.folded_index = ShardedFoldedIndex(self.dictionary)
+                else:
+                    self.folded_index = FoldedIndex(self.dictionary.words())
+
+        return self.folded_index
+
+    def __warm__(self):
+        # Constrói de uma vez o que as correções construiriam no primeiro uso,
+        # para que os processos de corrigir_lote herdem tudo pronto em vez de
+        # cada um refazer (e copiar) as mesmas estruturas
+        if isinstance(self.dictionary, ShardedReGra):
+            self.dictionary.all_shards()
+
+        self.dictionary.build_summaries()
+
+        # Com shards, o índice sem acentos de cada um também é montado na
+        # primeira consulta
+        if isinstance(self.__folded_index__(), ShardedFoldedIndex):
+            for key in self.dictionary.index:
+                self.dictionary.folded_index(key)
+
+        if self.search == 'deletions':
+            self.__delete_index__()
+        elif self.search == 'bktree':
+            self.__bk_tree__()
+
+        if self.tagger in ('local', 'fallback'):
+            self.__local_tagger__()
+
+    def cache_stats(self) -> dict[str, int]:
+        return self.corrections_cache.stats()
+
+    def folded_stats(self) -> dict:
+        return self.folded_index.stats() if self.folded_index is not None else {}
+
+    def __lxrequest__(self, text: str) -> str:
+        return self.parser.parse(text, format='parentheses')
+
+    def __lxtree__(self, text: str) -> Tree:
+        result = None
+        if self.parse_cache is not None:
+            result = self.parse_cache.get(text, self.symbol_convertion)
+
+        if result is None:
+            result = self.__lxrequest__(text)
+
+            if self.parse_cache is not None:
+                self.parse_cache.put(text, self.symbol_convertion, result)
+
+        # O serviço devolve uma árvore por linha, uma para cada frase
+        return join_trees([Tree.fromstring(x) for x in result.splitlines() if x.strip()])
+
+    async def __lxtree_async__(self, text: str) -> Tree:
+        # O cache em SQLite faz E/S e tem uma trava própria: roda fora do laço
+        loop = asyncio.get_running_loop()
+
+        result = None
+        if self.parse_cache is not None:
+            result = await loop.run_in_executor(
+                self.__executor__(), self.parse_cache.get, text, self.symbol_convertion)
+
+        if result is None:
+            # Sem aiohttp, a requisição síncrona roda em outra thread
+            if aiohttp is None:
+                result = await loop.run_in_executor(self.__executor__(), self.__lxrequest__, text)
+
+            else:
+                if self.async_parser is None:
+                    self.async_parser = AsyncLXParserClient(**self.parser.settings())
+
+                result = await self.async_parser.parse(text, format='parentheses')
+
+            if self.parse_cache is not None:
+                await loop.run_in_executor(
+                    self.__executor__(), self.parse_cache.put, text, self.symbol_convertion, result)
+
+        return join_trees([Tree.fromstring(x) for x in result.splitlines() if x.strip()])
 
     def __lxparse__(self, text: str):
-        '''
-        Arguments
-            text: a string with a maximum of 2000 characters, Portuguese text, with
-                the input to be processed
-            format: either 'parentheses', 'table' or 'JSON'
+        chunks = split_text(text)
 
-        Returns a string or JSON object with the output according to specification in
-        https://portulanclarin.net/workbench/lx-parser/
+        # Textos acima do limite do serviço são enviados em pedaços, em paralelo
+        if len(chunks) > 1:
+            tree = join_trees(list(self.__executor__().map(self.__lxtree__, chunks)))
 
-        Raises a WSException if an error occurs.
-        '''
+        else:
+            tree = self.__lxtree__(text)
 
-        request_data = {
-            'method': 'parse',
-            'jsonrpc': '2.0',
-            'id': 0,
-            'params': {
-                'text': text,
-                'format': 'parentheses',
-                'key': self.LXPARSER_WS_API_KEY,
-            },
-        }
+        return self.__lxwords__(tree), tree
+
+    async def __lxparse_async__(self, text: str):
+        chunks = split_text(text)
+        if len(chunks) <= 1:
+            chunks = [text]
+
+        semaphore = asyncio.Semaphore(self.max_workers)
+
+        async def parse(chunk: str):
+            async with semaphore:
+                return await self.__lxtree_async__(chunk)
+
+        tree = join_trees(await asyncio.gather(*[parse(chunk) for chunk in chunks]))
+
+        return self.__lxwords__(tree), tree
+
+    def __local_tagger__(self) -> LexiconTagger:
+        with self.lock:
+            if self.local_tagger is None:
+                self.local_tagger = LexiconTagger(self.dictionary)
+
+        return self.local_tagger
+
+    def __local_tag__(self, text: str):
+        return self.__local_tagger__().tag(text, self.symbol_convertion)
+
+    def __tag__(self, text: str):
+        if not isinstance(self.tagger, str):
+            return self.tagger.tag(text)
+
+        if self.tagger == 'local':
+            return self.__local_tag__(text)
+
+        try:
+            return self.__lxparse__(text)
 
-        request = requests.post(
-            'https://portulanclarin.net/workbench/lx-parser/api/', json=request_data)
-        response_data = request.json()
+        except TAGGER_FAILURES:
+            if self.tagger != 'fallback':
+                raise
 
-        if "error" in response_data:
-            raise WSException(response_data["error"])
+            return self.__local_tag__(text)
 
-        tree = Tree.fromstring(response_data["result"])
+    async def __tag_async__(self, text: str):
+        if not isinstance(self.tagger, str) or self.tagger == 'local':
+            return await asyncio.get_running_loop().run_in_executor(
+                self.__executor__(), self.__tag__, text)
 
+        try:
+            return await self.__lxparse_async__(text)
+
+        except TAGGER_FAILURES:
+            if self.tagger != 'fallback':
+                raise
+
+            return await asyncio.get_running_loop().run_in_executor(
+                self.__executor__(), self.__local_tag__, text)
+
+    def __lxwords__(self, tree: Tree):
         # Converte para uma lista de tuplas
         word_pos = tree.pos()
 
@@ -256,30 +2742,31 @@ class Corretor():
             if x[0].isalpha():
                 lx_parsed.append(x)
 
-        return lx_parsed, tree
+        return lx_parsed
 
     def __load_dicionary__(self, path: str):
-        dictionary = ReGra()
-
-        with open(path) as dic:
-            rd = csv.reader(dic, delimiter='\t', quotechar='"')
-            qtd_lines = sum(1 for _ in rd)
-            dic.seek(0)
-
-            progress = tqdm(total=qtd_lines, desc="Carregando dicionário")
-
-            for row in rd:
-                word = row[0]
-                raiz = [row[1]]
-                tag = [row[2]]
-                features = [x for x in row[3].split('|') if x]
+        # Um diretório de shards é carregado sob demanda
+        if is_sharded(path):
+            return ShardedReGra(path)
 
-                dictionary[word] = WordData(
-                    raiz=set(raiz), tag=set(tag), features=set(features))
+        # Um dicionário compilado é apenas mapeado em memória
+        if is_compiled(path):
+            return MappedReGra(path)
 
-                progress.update(1)
+        dictionary = ReGra()
 
-            progress.close()
+        progress = tqdm(total=os.path.getsize(path), unit='B',
+                        unit_scale=True, desc="Carregando dicionário")
+        start = time.perf_counter()
+        rows = dictionary.extend(read_lexicon(path, progress))
+        elapsed = time.perf_counter() - start
+        progress.close()
+
+        self.load_stats = {
+            'rows': rows,
+            'seconds': elapsed,
+            'rows_per_second': rows / elapsed if elapsed > 0 else 0.0,
+        }
 
         return dictionary
 
@@ -324,8 +2811,32 @@ class Corretor():
 
         return [[x[0], x[1]['tag']] for x in result]
 
-    def __get_corrections__(self, word: str, tag: str):
-        word = clean_text(word)
+    def __search__(self, word: str, tag: str | None = None) -> list[tuple[str, int]]:
+        # Só a busca na árvore filtra a etiqueta durante a descida; os índices
+        # à parte devolvem todas as palavras e o filtro fica para quem chama
+        if self.search == 'levenshtein':
+            return self.dictionary.search(word, self.max_distance, self.transpositions, tag)
+
+        if self.search == 'deletions':
+            return self.__delete_index__().lookup(word, self.max_distance, self.transpositions)
+
+        return self.__bk_tree__().query(word, self.max_distance)
+
+    def __delete_index__(self) -> DeleteIndex:
+        with self.lock:
+            if self.delete_index is None or self.delete_index.max_distance < self.max_distance:
+                self.delete_index = DeleteIndex(self.dictionary.words(), self.max_distance)
+
+        return self.delete_index
+
+    def __bk_tree__(self) -> BKTree:
+        with self.lock:
+            if self.bk_tree is None:
+                self.bk_tree = BKTree(self.dictionary.words())
+
+        return self.bk_tree
+
+    def __prefix_candidates__(self, word: str, tag: str | None = None) -> list[tuple[str, WordData]]:
         p = self.dictionary.get_parent(word)
 
         # Procura paralavras com 2 até dois caracteres a mais ou a menos
@@ -334,73 +2845,74 @@ class Corretor():
 
         max_depth = max(len(word) - len(p.head) + 2, 4.0)
 
-        children = self.dictionary.get_children(p, max_depth=max_depth)
+        return self.dictionary.get_entries(p, max_depth=max_depth, tag=tag)
+
+    def __get_corrections__(self, word: str, tag: str):
+        word = clean_text(word)
 
-        corrections = []
-        for c in children:
-            if tag == 'ANY' or tag in self.dictionary[c]['tag']:
-                corrections.append(c)
+        cached = self.corrections_cache.get((word, tag))
+        if cached is not None:
+            return list(cached)
 
-        corrections.sort(key=lambda x: levenshtein_distance(word, x))
+        wanted = None if tag == 'ANY' else tag
 
-        return corrections[:10]
+        # Primeiro nível: palavras que só diferem nos acentos dispensam a busca
+        accented = []
+        folded_index = self.__folded_index__()
+        if folded_index is not None:
+            accented = [c for c in folded_index.lookup(word)
+                        if c != word and (wanted is None or wanted in self.dictionary[c]['tag'])]
 
-    def __extract_details__(self, details: set[str]):
-        details_dict = {}
+        if accented:
+            corrections = accented[:10]
 
-        for x in details:
-            if x == '_':
-                continue
+        elif self.search == 'levenshtein':
+            corrections = [c for c, _ in self.__search__(word, wanted)][:10]
 
-            char, value = x.split('=')
-            if char in details_dict:
-                details_dict[char].append(value)
-            else:
-                details_dict[char] = [value]
+        elif self.search != 'prefix':
+            corrections = [c for c, _ in self.__search__(word)
+                           if wanted is None or wanted in self.dictionary[c]['tag']][:10]
 
-        return details_dict
+        else:
+            corrections = [c for c, _ in self.__prefix_candidates__(word, wanted)]
+            corrections = nearest(word, corrections, 10, self.transpositions)
+
+        self.corrections_cache.put((word, tag), tuple(corrections))
+
+        return corrections
 
     def __prune_corrections__(self, corrections, tree: Tree):
-        # Extrai os detalhes
-        details = set()
+        # Perfil da frase: união dos bits das features de cada palavra
+        profile = 0
         for x in tree.leaves():
             d = self.dictionary[x]
 
             if d is not None:
-                details = details.union(d['features'])
+                profile |= entry_mask(d)
 
         # Condensa as palavras que têm a mesma raiz
         same_root = {}
+        masks = {}
         for x in corrections:
-            roots = self.dictionary[x]['raiz']
+            data = self.dictionary[x]
+            masks[x] = entry_mask(data)
 
-            for root in roots:
+            for root in data['raiz']:
                 if root in same_root:
                     same_root[root].append(x)
                 else:
                     same_root[root] = [x]
 
         # Seleciona as palavras que possuem maior similaridade com o resto da frase
-        characteristics = self.__extract_details__(details)
         pruned_corrections = []
         for _, similar_words in same_root.items():
             if len(similar_words) == 1:
                 pruned_corrections.append(similar_words[0])
                 continue
 
-            score = {}
-            best_combination = 0
-            for word in similar_words:
-                score[word] = 0
-                word_details = self.__extract_details__(
-                    self.dictionary[word]['features'])
-
-                for char, values in word_details.items():
-                    if char in characteristics.keys() and values[0] in characteristics[char]:
-                        score[word] += 1
-
-                if best_combination < score[word]:
-                    best_combination = score[word]
+            score = {word: (masks[word] & profile).bit_count()
+                     for word in similar_words}
+            best_combination = max(score.values())
 
             for word in similar_words:
                 if score[word] == best_combination:
@@ -408,8 +2920,7 @@ class Corretor():
 
         return pruned_corrections
 
-    def corrigir_texto(self, texto: str):
-        lx_parsed, tree = self.__lxparse__(texto)
+    def __correct__(self, lx_parsed, tree: Tree):
         dict_parsed = self.__parsing__(' '.join([x[0].lower() for x in lx_parsed]))
         aligned_classes = self.__aligning__(dict_parsed, lx_parsed)
 
@@ -429,3 +2940,100 @@ class Corretor():
                 corrections[word[0]] = None
 
         return corrections
+
+    def corrigir_texto(self, texto: str):
+        return self.__correct__(*self.__tag__(texto))
+
+    def corrigir_lote(self, textos: list[str], workers: int = os.cpu_count() or 1,
+                      chunksize: int = 16) -> list[dict]:
+        '''
+        Corrige vários textos em paralelo, em workers processos.
+
+        Os processos são criados com fork e herdam o dicionário já carregado:
+        as páginas são compartilhadas até serem escritas (ou, com MappedReGra,
+        pelo próprio mapeamento do arquivo). Os resultados saem na ordem de
+        textos e o desempenho de cada processo fica em self.batch_stats.
+        '''
+        global _lote_corretor
+
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            raise RuntimeError('corrigir_lote requires the fork start method')
+
+        results = [None] * len(textos)
+        stats = {}
+
+        # Congela os objetos atuais para que o coletor dos filhos não os
+        # percorra, o que copiaria as páginas do dicionário em cada processo
+        self.__warm__()
+        _lote_corretor = self
+        gc.freeze()
+
+        try:
+            with multiprocessing.get_context('fork').Pool(workers) as pool:
+                gc.unfreeze()
+
+                for index, result, pid, elapsed in pool.imap_unordered(
+                        _corrigir_lote_worker, enumerate(textos), chunksize):
+                    results[index] = result
+
+                    worker = stats.setdefault(pid, {'texts': 0, 'seconds': 0.0})
+                    worker['texts'] += 1
+                    worker['seconds'] += elapsed
+
+        finally:
+            gc.unfreeze()
+            _lote_corretor = None
+
+        for worker in stats.values():
+            worker['texts_per_second'] = worker['texts'] / worker['seconds'] if worker['seconds'] else 0.0
+
+        self.batch_stats = stats
+
+        return results
+
+    async def corrigir_texto_async(self, texto: str):
+        # A requisição ao parser é aguardada sem bloquear o laço de eventos e a
+        # busca de correções, que usa CPU, roda no executor
+        lx_parsed, tree = await self.__tag_async__(texto)
+
+        return await asyncio.get_running_loop().run_in_executor(
+            self.__executor__(), self.__correct__, lx_parsed, tree)
+
+
+
+# Corretor herdado pelos processos de corrigir_lote
+_lote_corretor: Corretor | None = None
+_lote_forked = False
+
+
+def _corrigir_lote_worker(item: tuple[int, str]):
+    global _lote_forked
+
+    # Feito na primeira tarefa e não num initializer do Pool: se falhar, o erro
+    # chega a quem chamou corrigir_lote em vez de o Pool recriar o processo
+    if not _lote_forked:
+        _lote_corretor.__after_fork__()
+        _lote_forked = True
+
+    index, text = item
+
+    start = time.perf_counter()
+    result = _lote_corretor.corrigir_texto(text)
+
+    return index, result, os.getpid(), time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    import sys
+
+    # python corretor.py --shards portilexicon-ud.tsv portilexicon-ud/
+    if sys.argv[1] == '--shards':
+        write_shards(sys.argv[2], sys.argv[3])
+        sys.exit()
+
+    # python corretor.py portilexicon-ud.tsv portilexicon-ud.regra [portilexicon-ud.del]
+    dictionary = Corretor(sys.argv[1]).dictionary
+    dictionary.compile(sys.argv[2])
+
+    if len(sys.argv) > 3:
+        DeleteIndex(dictionary.words()).save(sys.argv[3])
@@ -1,25 +1,28 @@
 import streamlit as st
-import csv
+import os
 from llama_cpp import Llama
-from corretor import Corretor, WordData, ReGra, lxparse_symbols
+from corretor import Corretor, ReGra, MappedReGra, ShardedReGra, is_sharded, read_lexicon, lxparse_symbols
+
+
+SUGGESTIONS = 5
 
 
 @st.cache_resource
 def load_dictionary():
     print('Loading dictionary...')
-    dictionary = ReGra()
 
-    with open('./portilexicon-ud.tsv') as dic:
-        rd = csv.reader(dic, delimiter='\t', quotechar='"')
+    # Gerado com: python corretor.py --shards portilexicon-ud.tsv portilexicon-ud
+    # A primeira correção só espera pelos shards que usa; o resto vem em segundo plano
+    if is_sharded('./portilexicon-ud'):
+        dictionary = ShardedReGra('./portilexicon-ud', prefetch=True)
 
-        for row in rd:
-            word = row[0]
-            raiz = [row[1]]
-            tag = [row[2]]
-            features = [x for x in row[3].split('|') if x]
+    # Gerado com: python corretor.py portilexicon-ud.tsv portilexicon-ud.regra
+    elif os.path.exists('./portilexicon-ud.regra'):
+        dictionary = MappedReGra('./portilexicon-ud.regra')
 
-            dictionary[word] = WordData(
-                raiz=set(raiz), tag=set(tag), features=set(features))
+    else:
+        dictionary = ReGra()
+        dictionary.extend(read_lexicon('./portilexicon-ud.tsv'))
 
     return dictionary
 
@@ -65,11 +68,17 @@ def rewrite(question: str, context: str | None = None, full_output=False, seed=4
     return output['choices'][0]['text'].split(':')[-1] if not full_output else output
 
 
-dictionary = load_dictionary()
-
-corretor = Corretor(dictionary=dictionary,
+@st.cache_resource
+def load_corretor():
+    # Um só corretor entre as execuções do script: os índices construídos no
+    # primeiro uso e o cache de correções são mantidos
+    return Corretor(dictionary=load_dictionary(),
                     key=st.secrets["lxparser_key"], symbols=lxparse_symbols)
 
+
+dictionary = load_dictionary()
+corretor = load_corretor()
+
 if 'text_area_value' not in st.session_state:
     st.session_state.text_area_value = ''
 
@@ -84,6 +93,13 @@ text = st.text_area('Input', key='frase',
                     value=st.session_state.text_area_value,
                     on_change=update_text_area_value)
 
+# Sugestões para a palavra que está sendo digitada
+if text and not text[-1].isspace():
+    suggestions = dictionary.autocomplete(text.split()[-1].lower(), SUGGESTIONS)
+
+    if suggestions:
+        st.caption('Sugestões: ' + ', '.join(suggestions))
+
 left_button, right_button, _ = st.columns([0.2, 0.25, 1])
 
 result = ''
@@ -1,3 +1,7 @@
+import csv
+import sys
+import time
+import tracemalloc
 from typing import TypedDict
 
 
@@ -8,89 +12,286 @@ class WordData(TypedDict):
 
 
 class Node():
-    def __init__(self, prox: list[str] = [], prev: list[str] = []):
-        self.prox = prox
-        self.prev = prev
+    __slots__ = ('prox', 'final')
+
+    def __init__(self):
+        self.prox: dict[str, 'Node'] = {}
+        self.final = False
+
+    def signature(self) -> tuple:
+        # Children are already unique when this is called, so two nodes accept
+        # the same suffixes iff they agree on finality and on child identities
+        return (self.final, tuple((char, id(node)) for char, node in self.prox.items()))
 
 
 class TreeDict():
+    '''
+    Minimal deterministic acyclic automaton (DAWG) holding the dictionary words.
+
+    Words must be inserted in sorted order. When a new word arrives, the part of
+    the previous word it does not share can no longer change, so those nodes are
+    swapped for equivalent ones seen before. Common suffixes end up stored once,
+    just like common prefixes. The word data is kept in the words map.
+
+    For positional queries (match, substitutions) the words are also indexed by
+    layers, one transition map per character position: layer i maps each char
+    to the set of words having it at position i, stored as a bitset over the
+    word ids (their sorted order). Constraints are answered by intersecting
+    those sets, without scanning the words.
+    '''
+
     def __init__(self):
-        self.first_layer: dict[str, Node] = {}
-        self.middle_layers: list[dict[str, Node]] = []
-        self.last_layer: dict[str, Node] = {}
-        
+        self.root = Node()
         self.words: dict[str, WordData] = {}
 
+        # Nodes already minimized, by signature, and the path of the last word
+        # that may still be extended
+        self.register: dict[tuple, Node] = {}
+        self.unchecked: list[tuple[Node, str, Node]] = []
+        self.previous = ''
+        self.finished = False
+
+        # Positional index, rebuilt on the first query after an insertion
+        self.keys: list[str] = []
+        self.layers: list[dict[str, int]] | None = None
+        self.lengths: dict[int, int] = {}
+
+    def walk(self, word: str) -> Node | None:
+        node = self.root
+        for char in word:
+            node = node.prox.get(char)
+            if node is None:
+                return None
+
+        return node
+
+    def __contains__(self, word: str) -> bool:
+        node = self.walk(word)
+        return node is not None and node.final
+
     def __getitem__(self, word: str):
-        if word in self.words.keys():
-            return self.words[word]
-        else:
-            None
+        return self.words.get(word)
+
+    def __len__(self) -> int:
+        return len(self.words)
 
     def __setitem__(self, idx: str, value: WordData):
-        # First layer and last layer must be set manually
-        if idx[0] not in self.first_layer: # Creates new node
-            self.first_layer[idx[0]] = Node(prox=[idx[1]])
-            
-        elif idx[1] not in self.first_layer[idx[0]].prox: # Adds new transition
-            self.first_layer[idx[0]].prox.append(idx[1])
-        
-        # Intertwine the middle layers
-        for i in range(1, len(idx) - 1):
-            if idx[i] not in self.middle_layers[i - 1]:
-                self.middle_layers[i - 1][idx[i]] = Node(prox=[idx[i + 1]], prev=[idx[i - 1]])
-                
-            else: 
-                if idx[i + 1] not in self.middle_layers[i - 1][idx[i]].prox:
-                    self.middle_layers[i - 1][idx[i]].prox.append(idx[i + 1])
-                    
-                if idx[i - 1] not in self.middle_layers[i - 1][idx[i]].prev:
-                    self.middle_layers[i - 1][idx[i]].prev.append(idx[i - 1])
-        
-        # Last layer
-        if idx[-1] not in self.last_layer:
-            self.last_layer[idx[-1]] = Node(prev=[idx[-2]])
-            
-        elif idx[-2] not in self.last_layer[idx[-1]].prev:
-            self.last_layer[idx[-1]].prev.append(idx[-2])
-            
-        # Add the word to the hashmap or updates it
-        if idx not in self.words:
-            self.words[idx] = value
-        else:
-            self.words[idx].root = self.words[idx].root.union(value.root)
-            self.words[idx].tag = self.words[idx].tag.union(value.tag)
-            self.words[idx].features = self.words[idx].features.union(value.features)
-                        
-    # def __repr__(self) -> str:
-    #     string = ''
-    #     for node in self.nodes.values():
-    #         string += self.build_tree(node)
+        # Repeated words only update the data
+        if idx in self.words:
+            data = self.words[idx]
+            data['root'] = data['root'].union(value['root'])
+            data['tag'] = data['tag'].union(value['tag'])
+            data['features'] = data['features'].union(value['features'])
+            return
+
+        if self.finished:
+            raise ValueError('TreeDict is finished, no more words can be added')
+
+        if idx < self.previous:
+            raise ValueError(f'words must be inserted in sorted order: {idx!r} after {self.previous!r}')
+
+        common = 0
+        limit = min(len(idx), len(self.previous))
+        while common < limit and idx[common] == self.previous[common]:
+            common += 1
+
+        self.minimize(common)
+
+        node = self.unchecked[-1][2] if self.unchecked else self.root
+        for char in idx[common:]:
+            child = Node()
+            node.prox[char] = child
+            self.unchecked.append((node, char, child))
+            node = child
+
+        node.final = True
+        self.previous = idx
+        self.words[idx] = value
+        self.layers = None
+
+    def minimize(self, down_to: int):
+        while len(self.unchecked) > down_to:
+            parent, char, child = self.unchecked.pop()
+            key = child.signature()
+
+            if key in self.register:
+                parent.prox[char] = self.register[key]
+            else:
+                self.register[key] = child
+
+    def extend(self, rows) -> int:
+        count = 0
+        for word, value in rows:
+            if word:
+                self[word] = value
+                count += 1
+
+        return count
+
+    def finish(self):
+        # Minimizes the last word; the register is only needed while building
+        self.minimize(0)
+        self.register = {}
+        self.finished = True
+
+    def nodes(self):
+        # Each node once, even when shared by several words
+        seen = {id(self.root)}
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            yield node
+
+            for child in node.prox.values():
+                if id(child) not in seen:
+                    seen.add(id(child))
+                    stack.append(child)
+
+    def node_count(self) -> int:
+        return sum(1 for _ in self.nodes())
+
+    def index(self) -> list[dict[str, int]]:
+        if self.layers is None:
+            # Words are inserted in sorted order, so the words map is already sorted
+            self.keys = list(self.words)
+            size = (len(self.keys) + 7) // 8
+
+            layers: list[dict[str, bytearray]] = []
+            lengths: dict[int, bytearray] = {}
+            for idx, word in enumerate(self.keys):
+                byte, bit = idx >> 3, 1 << (idx & 7)
+
+                while len(layers) < len(word):
+                    layers.append({})
+
+                for layer, char in zip(layers, word):
+                    if char not in layer:
+                        layer[char] = bytearray(size)
+                    layer[char][byte] |= bit
+
+                if len(word) not in lengths:
+                    lengths[len(word)] = bytearray(size)
+                lengths[len(word)][byte] |= bit
+
+            self.lengths = {n: int.from_bytes(bits, 'little') for n, bits in lengths.items()}
+            self.layers = [{char: int.from_bytes(bits, 'little') for char, bits in layer.items()}
+                           for layer in layers]
+
+        return self.layers
+
+    def position(self, i: int, char: str) -> int:
+        layers = self.index()
+        return layers[i].get(char, 0) if i < len(layers) else 0
+
+    def decode(self, bits: int) -> list[str]:
+        words = []
+        for byte, value in enumerate(bits.to_bytes((bits.bit_length() + 7) // 8, 'little')):
+            while value:
+                low = value & -value
+                words.append(self.keys[byte * 8 + low.bit_length() - 1])
+                value ^= low
+
+        return words
+
+    def match(self, pattern: str | None = None, prefix: str = '', suffix: str = '',
+              length: int | None = None) -> list[str]:
+        '''
+        Words matching every given constraint, in sorted order.
+
+        pattern has one character per position and '?' matches any character,
+        so match('c?sa') gives 'casa' and 'cosa'. prefix, suffix and length can
+        be combined with it or used alone, e.g.
+        match(prefix='des', suffix='ção', length=9).
+        '''
+        self.index()
+
+        if pattern is not None:
+            if length is not None and length != len(pattern):
+                return []
+            length = len(pattern)
+
+        bits = 0
+        for n in ([length] if length is not None else sorted(self.lengths)):
+            if len(prefix) > n or len(suffix) > n:
+                continue
+
+            fixed = list(enumerate(prefix))
+            fixed += [(n - len(suffix) + i, char) for i, char in enumerate(suffix)]
+            if pattern is not None:
+                fixed += [(i, char) for i, char in enumerate(pattern) if char != '?']
+
+            candidates = self.lengths.get(n, 0)
+            for i, char in fixed:
+                if not candidates:
+                    break
+                candidates &= self.position(i, char)
+
+            bits |= candidates
+
+        return self.decode(bits)
+
+    def substitutions(self, word: str, position: int | None = None) -> list[str]:
+        '''
+        Words of the same length as word that differ from it only at position
+        (at any single position if it is None), i.e. the dictionary words one
+        substitution away.
+        '''
+        self.index()
+
+        n = len(word)
+        masks = [self.position(i, char) for i, char in enumerate(word)]
+
+        # before[i] and after[i] intersect the positions left and right of i
+        before = [self.lengths.get(n, 0)]
+        for mask in masks:
+            before.append(before[-1] & mask)
+
+        after = [0] * n + [-1]
+        for i in range(n - 1, -1, -1):
+            after[i] = after[i + 1] & masks[i]
+
+        positions = range(n) if position is None else [position]
+        bits = 0
+        for i in positions:
+            bits |= before[i] & after[i + 1] & ~masks[i]
+
+        return self.decode(bits)
 
-    #     return string
+    def search(self, word: str, max_distance: int = 2) -> list[tuple[str, int]]:
+        # Walks the automaton carrying one row of the Levenshtein matrix per
+        # character; a branch is dropped once the whole row exceeds max_distance
+        results = []
+        size = len(word)
 
-    # def build_tree(self, current: Node, depth: int = 0):
-    #     string = f"{'-' * depth} {current.head}{' OK' if current.data is not None else ''}\n"
+        stack = [(char, node, '', list(range(size + 1))) for char, node in self.root.prox.items()]
+        while stack:
+            char, node, prefix, row = stack.pop()
 
-    #     for node in current.prox.values():
-    #         string += self.build_tree(node, depth + 1)
+            new_row = [row[0] + 1]
+            for j in range(1, size + 1):
+                new_row.append(min(new_row[j - 1] + 1, row[j] + 1,
+                                   row[j - 1] + (word[j - 1] != char)))
 
-    #     return string
+            if min(new_row) > max_distance:
+                continue
 
-    # def get_children(self, current: Node, max_depth: int = 10, depth: int = 0) -> list[str]:
-    #     if depth >= max_depth:
-    #         return []
+            head = prefix + char
+            if node.final and new_row[size] <= max_distance:
+                results.append((head, new_row[size]))
 
-    #     children = []
+            for child in node.prox.items():
+                stack.append((*child, head, new_row))
 
-    #     for node in current.prox.values():
-    #         if node.data is not None:
-    #             children.append(node.head)
+        results.sort(key=lambda x: (x[1], x[0]))
 
-    #         children += self.get_children(node,
-    #                                       max_depth=max_depth, depth=depth + 1)
+        return results
 
-    #     return children
+
+def read_lexicon(path: str):
+    with open(path, encoding='utf-8') as dic:
+        for row in csv.reader(dic, delimiter='\t', quotechar='"'):
+            features = [x for x in row[3].split('|') if x]
+            yield row[0], WordData(root={row[1]}, tag={row[2]}, features=set(features))
 
 
 def levenshtein_distance(word1, word2):
@@ -124,6 +325,17 @@ def clean_text(text: str):
         '!', '').replace('?', '').replace(';', '')
 
 
+def measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return result, memory, elapsed
+
+
 # class WSException(Exception):
 #     'Webservice Exception'
 
@@ -375,3 +587,49 @@ def clean_text(text: str):
 #                 corrections[word[0]] = None
 
 #         return corrections
+
+
+if __name__ == '__main__':
+    # python corretorv2.py portilexicon-ud.tsv
+    from corretor import ReGra
+
+    def build_regra():
+        dictionary = ReGra()
+        for word, value in read_lexicon(sys.argv[1]):
+            dictionary[word] = {'raiz': value['root'], 'tag': value['tag'], 'features': value['features']}
+        return dictionary
+
+    def build_tree_dict():
+        dictionary = TreeDict()
+        dictionary.extend(sorted(read_lexicon(sys.argv[1]), key=lambda row: row[0]))
+        dictionary.finish()
+        return dictionary
+
+    _, memory, elapsed = measure(build_regra)
+    print(f'{"ReGra":<10} {memory / 2**20:>10.1f} MiB {elapsed:>8.1f}s')
+
+    tree_dict, memory, elapsed = measure(build_tree_dict)
+    print(f'{"TreeDict":<10} {memory / 2**20:>10.1f} MiB {elapsed:>8.1f}s')
+
+    # Most of the TreeDict is the words map; the automaton itself is tiny
+    automaton = sum(sys.getsizeof(node) + sys.getsizeof(node.prox) for node in tree_dict.nodes())
+    print(f'{"automaton":<10} {automaton / 2**20:>10.1f} MiB'
+          f' ({tree_dict.node_count()} nodes for {len(tree_dict)} words)')
+
+    # Substitution typos: positional index against the bounded search
+    words = list(tree_dict.words)
+    typos = []
+    for word in words[::max(1, len(words) // 200)]:
+        i = len(word) // 2
+        typos.append(word[:i] + ('a' if word[i] != 'a' else 'e') + word[i + 1:])
+
+    _, memory, elapsed = measure(tree_dict.index)
+    print(f'{"layers":<10} {memory / 2**20:>10.1f} MiB {elapsed:>8.1f}s')
+
+    for name, query in [('substitutions', tree_dict.substitutions),
+                        ('search', lambda typo: tree_dict.search(typo, 1))]:
+        start = time.perf_counter()
+        for typo in typos:
+            query(typo)
+        elapsed = time.perf_counter() - start
+        print(f'{name:<14} {elapsed / len(typos) * 1e3:>8.2f} ms/query')